@@ -1,25 +1,32 @@
 var hostIp = '172.17.235.66'
-var currentImage = "";
-var currentTtc = "";
+
+/* Each message from the servers starts with its length as a 4-byte integer
+   (in network byte order). This returns a 'data' handler that collects the
+   received data and calls onMessage with the data of each whole message. */
+function messageReader(onMessage) {
+    var pending = new Buffer(0);
+
+    return function(data) {
+        pending = Buffer.concat([pending, data]);
+        while (pending.length >= 4) {
+            var length = pending.readUInt32BE(0);
+            if (pending.length < 4 + length) {
+                break;
+            }
+            onMessage(pending.slice(4, 4 + length));
+            pending = pending.slice(4 + length);
+        }
+    };
+}
 
 /* IMAGE SERVER CONNECTION */
 
 DASH.info.imageConnection = net.connect({port: 11111, host: hostIp}, function() {
    console.log('connected to image server');
 });
-DASH.info.imageConnection.on('data', function(data) {
-
-    var result = data.toString();
-
-    for (var i = 0; i != result.length; i++) {
-        if (result[i] == "\n") {
-            document.getElementById("imageDisplay").src = "data:image/jpeg;base64," + currentImage;
-            currentImage = "";
-        } else {
-            currentImage += result[i];
-        }
-    }
-});
+DASH.info.imageConnection.on('data', messageReader(function(message) {
+    document.getElementById("imageDisplay").src = "data:image/jpeg;base64," + message.toString('base64');
+}));
 DASH.info.imageConnection.on('end', function() {
    console.log('disconnected from image server');
 });
@@ -37,23 +44,13 @@ function round_value(value) {
 DASH.info.ttcConnection = net.connect({port: 22222, host: hostIp}, function() {
    console.log('connected to ttc server');
 });
-DASH.info.ttcConnection.on('data', function(data) {
-
-    var result = data.toString();
-
-    for (var i = 0; i != result.length; i++) {
-        if (result[i] == "\n") {
-            var object = JSON.parse(currentTtc);
-            var min = round_value(object['min-ttc']);
-            var right = round_value(object['right-ttc']);
-            var left = round_value(object['left-ttc']);
-            updateTtc(min, right, left);
-            currentTtc = "";
-        } else {
-            currentTtc += result[i];
-        }
-    }
-});
+DASH.info.ttcConnection.on('data', messageReader(function(message) {
+    var object = JSON.parse(message.toString());
+    var min = round_value(object['min-ttc']);
+    var right = round_value(object['right-ttc']);
+    var left = round_value(object['left-ttc']);
+    updateTtc(min, right, left);
+}));
 DASH.info.imageConnection.on('end', function() {
    console.log('disconnected from ttc server');
 });
\ No newline at end of file
@@ -31,6 +31,15 @@ class Camera:
         """
         pass
 
+    def get_timestamp(self, raw_frame):
+        """
+        Abstract function that returns the capture time (in seconds) of a raw
+        frame. The time is taken from a monotonic clock, so it is only
+        meaningful when compared with the capture times of other frames. This
+        function must be called before get_frame.
+        """
+        pass
+
     def destroy(self):
         """
         Abstract function that cleans up memory after use of the class.
@@ -0,0 +1,155 @@
+"""
+This module implements a capture stage that retrieves camera frames in its own
+thread. The most recent frames are kept in a bounded ring together with the
+time at which they were captured, so slow frame processing never delays the
+capture of the next frame.
+"""
+
+__author__ = "Ron Wright"
+__copyright__ = "Copyright 2015 Ronald Joseph Wright"
+__maintainer__ = "Ron Wright"
+
+from collections import deque
+from threading import Condition, Thread
+import traceback
+
+class FrameGrabberIterator:
+    """
+    Iterator class for FrameGrabber. This is used to obtain a continuous
+    stream of (frame, capture time) pairs.
+    """
+    def __init__(self, grabber):
+        """
+        Constructor for FrameGrabberIterator.
+        """
+        self.grabber = grabber
+
+    def __iter__(self):
+        """
+        Return a reference to the iterator, which is the FrameGrabberIterator
+        class itself.
+        """
+        return self
+
+    def next(self):
+        """
+        Retrieves the next frame and returns it. (Python 2.x function)
+        """
+        return self.__next__()
+
+    def __next__(self):
+        """
+        Retrieves the next frame and returns it. (Python 3.x function)
+        """
+        item = self.grabber.get_frame()
+        if item is None:
+            raise StopIteration
+        return item
+
+class FrameGrabber:
+    """
+    Class for retrieving frames from a camera in a separate thread.
+    """
+    def __init__(self, camera, buffer_size=2, latest_only=True):
+        """
+        Constructor for FrameGrabber, where camera is the Camera to retrieve
+        frames from, the optional parameter buffer_size (with default value 2)
+        is the maximum number of frames kept in the ring, and the optional
+        parameter latest_only (with default value True) determines whether
+        only the most recent frame is handed out, dropping any older frames
+        that have not been retrieved yet. When the ring is full, the oldest
+        frame is always dropped.
+        """
+        self.camera = camera
+        self.frames = deque(maxlen=buffer_size)
+        self.latest_only = latest_only
+        self.dropped_frames = 0
+        self.running = False
+        self.finished = False
+        self.cv = Condition()
+        self.thread = None
+
+    def capture_frames(self):
+        """
+        Capture thread function that retrieves camera frames until the grabber
+        is stopped or the camera runs out of frames. If the camera fails, the
+        error is printed and the thread finishes as if the camera had run out
+        of frames, so the consumer is never left waiting. This function should
+        not be used directly outside this class.
+        """
+        try:
+            for raw_frame in self.camera.get_iterator():
+                capture_time = self.camera.get_timestamp(raw_frame)
+                the_frame = self.camera.get_frame(raw_frame)
+                self.cv.acquire()
+                if len(self.frames) == self.frames.maxlen:
+                    self.dropped_frames += 1
+                self.frames.append((the_frame, capture_time))
+                self.cv.notify_all()
+                running = self.running
+                self.cv.release()
+                if not running:
+                    break
+        except Exception:
+            traceback.print_exc()
+        finally:
+            self.cv.acquire()
+            self.finished = True
+            self.cv.notify_all()
+            self.cv.release()
+
+    def start(self):
+        """
+        Starts the capture thread.
+        """
+        self.running = True
+        self.finished = False
+        self.thread = Thread(target=self.capture_frames)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops the capture thread and waits for it to finish.
+        """
+        self.cv.acquire()
+        self.running = False
+        self.cv.release()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def get_frame(self):
+        """
+        Waits for a frame and returns it as a pair containing the frame and
+        its capture time (in seconds, as given by the camera). None is
+        returned once the capture thread has finished and all remaining frames
+        have been retrieved.
+        """
+        self.cv.acquire()
+        try:
+            while len(self.frames) == 0:
+                if self.finished:
+                    return None
+                self.cv.wait()
+            if self.latest_only:
+                self.dropped_frames += len(self.frames) - 1
+                item = self.frames.pop()
+                self.frames.clear()
+                return item
+            return self.frames.popleft()
+        finally:
+            self.cv.release()
+
+    def get_iterator(self):
+        """
+        Returns the iterator FrameGrabberIterator.
+        """
+        return FrameGrabberIterator(self)
+
+    def get_dropped_frame_count(self):
+        """
+        Returns the number of frames that were dropped because newer frames
+        were available.
+        """
+        return self.dropped_frames
@@ -9,6 +9,13 @@ __maintainer__ = "Ron Wright"
 
 from camera import Camera
 import cv2
+import time
+
+# OpenCV 2.x only exposes the property under cv2.cv, but the value is the same
+CAP_PROP_POS_MSEC = getattr(cv2, 'CAP_PROP_POS_MSEC', 0)
+
+# Python 2.x has no monotonic clock, so fall back to wall-clock time there
+monotonic = getattr(time, 'monotonic', time.time)
 
 class GenericCameraIterator:
     """
@@ -51,6 +58,10 @@ class GenericCamera(Camera):
         """
         self.cap = cv2.VideoCapture(0)
 
+        # Whether the capture times come from the capture backend or from the
+        # monotonic clock, which is decided once for the first frame
+        self.use_pos_msec = None
+
     def get_iterator(self):
         """
         Returns the iterator GenericCameraIterator.
@@ -64,6 +75,20 @@ class GenericCamera(Camera):
         """
         return raw_frame
 
+    def get_timestamp(self, raw_frame):
+        """
+        Returns the capture time (in seconds) of the frame reported by the
+        capture backend. If the backend does not report a capture time for
+        the first frame, the time at which this function is called is used
+        instead for all frames, so the capture times of a stream never mix
+        two clocks.
+        """
+        if self.use_pos_msec is None:
+            self.use_pos_msec = self.cap.get(CAP_PROP_POS_MSEC) > 0
+        if self.use_pos_msec:
+            return self.cap.get(CAP_PROP_POS_MSEC) / 1000.0
+        return monotonic()
+
     def destroy(self):
         """
         Cleans up memory used for OpenCV camera capture.
@@ -43,6 +43,15 @@ class ThePiCamera(Camera):
         self.rawCapture.truncate(0)
         return array
 
+    def get_timestamp(self, raw_frame):
+        """
+        Returns the capture time (in seconds) of the frame according to the
+        camera's own clock, read as soon as the frame has been captured. The
+        per-frame timestamps of the camera are only available while video is
+        being recorded, which is not the case for continuous captures.
+        """
+        return self.camera.timestamp / 1000000.0
+
     def destroy(self):
         """
         Cleans up memory used for Raspberry Pi camera capture.
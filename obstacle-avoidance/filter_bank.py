@@ -0,0 +1,303 @@
+"""
+This module contains functions implementing a bank of filters. The scheme
+accepts more than one input for multiple streams of data, which allows
+filtering to be performed on each component in one go. The data are kept in a
+fixed-size array, so no memory is allocated when the filters are updated. The
+actual filtering is done by a kernel, which can be swapped out:
+
+1. MedianKernel, the median over the window
+2. TrimmedMeanKernel, the mean over the window without its extreme values
+3. ExponentialKernel, exponential smoothing
+4. KalmanKernel, a scalar Kalman filter for each input
+
+The last two kernels keep their own state across updates, so they are best
+used with a sliding window.
+"""
+
+__author__ = "Ron Wright"
+__copyright__ = "Copyright 2015 Ronald Joseph Wright"
+__maintainer__ = "Ron Wright"
+
+from bisect import bisect_left, insort
+from collections import deque
+import numpy as np
+
+class MedianKernel:
+    """
+    Kernel class that computes the median of each input over the window. The
+    values of each input are also kept in sorted order, which is updated
+    with a binary search as values enter and leave the window, so the median
+    can be read off directly instead of sorting the window on every update.
+    """
+    def allocate(self, num_inputs, filter_size):
+        """
+        Allocates the buffers of the kernel for num_inputs inputs and a window
+        of filter_size values.
+        """
+        self.filter_size = filter_size
+        self.arrivals = [deque() for _ in range(num_inputs)]
+        self.sorted_windows = [[] for _ in range(num_inputs)]
+        middle = filter_size // 2
+        if filter_size % 2 == 1:
+            self.middle = (middle,)
+        else:
+            self.middle = (middle - 1, middle)
+
+    def reset(self):
+        """
+        Resets the state of the kernel in place.
+        """
+        for arrivals, sorted_window in zip(self.arrivals, \
+                                           self.sorted_windows):
+            arrivals.clear()
+            del sorted_window[:]
+
+    def observe(self, new_values):
+        """
+        Moves the newest values of all inputs into the sorted windows, taking
+        out the oldest values once the windows are full.
+        """
+        for arrivals, sorted_window, new_value in \
+            zip(self.arrivals, self.sorted_windows, new_values):
+            new_value = float(new_value)
+            if len(arrivals) == self.filter_size:
+                del sorted_window[bisect_left(sorted_window, \
+                                              arrivals.popleft())]
+            arrivals.append(new_value)
+            insort(sorted_window, new_value)
+
+    def compute(self, window, output):
+        """
+        Reads the median of each input off its sorted window and stores it in
+        output. The window itself is not used.
+        """
+        if len(self.middle) == 1:
+            middle = self.middle[0]
+            for index, sorted_window in enumerate(self.sorted_windows):
+                output[index] = sorted_window[middle]
+        else:
+            lower, upper = self.middle
+            for index, sorted_window in enumerate(self.sorted_windows):
+                output[index] = 0.5 * (sorted_window[lower] + \
+                                       sorted_window[upper])
+
+class TrimmedMeanKernel:
+    """
+    Kernel class that computes the mean of each input over the window after
+    discarding its smallest and largest values.
+    """
+    def __init__(self, num_trimmed=1):
+        """
+        Constructor for TrimmedMeanKernel, where the optional parameter
+        num_trimmed (with default value 1) is the number of values discarded
+        at each end of the sorted window.
+        """
+        self.num_trimmed = num_trimmed
+
+    def allocate(self, num_inputs, filter_size):
+        """
+        Allocates the buffers of the kernel for num_inputs inputs and a window
+        of filter_size values.
+        """
+        self.scratch = np.zeros((num_inputs, filter_size))
+        self.num_trimmed = min(self.num_trimmed, (filter_size - 1) // 2)
+
+    def reset(self):
+        """
+        Resets the state of the kernel. The trimmed mean only depends on the
+        window, so nothing needs to be done here.
+        """
+        pass
+
+    def observe(self, new_values):
+        """
+        Observes the newest values of all inputs. The trimmed mean only
+        depends on the window, so nothing needs to be done here.
+        """
+        pass
+
+    def compute(self, window, output):
+        """
+        Computes the trimmed mean of each row of window and stores it in
+        output.
+        """
+        np.copyto(self.scratch, window)
+        self.scratch.sort(axis=1)
+        end = self.scratch.shape[1] - self.num_trimmed
+        np.mean(self.scratch[:, self.num_trimmed:end], axis=1, out=output)
+
+class ExponentialKernel:
+    """
+    Kernel class that performs exponential smoothing on each input.
+    """
+    def __init__(self, alpha=0.5):
+        """
+        Constructor for ExponentialKernel, where the optional parameter alpha
+        (with default value 0.5) is the weight given to the newest value.
+        """
+        self.alpha = alpha
+
+    def allocate(self, num_inputs, filter_size):
+        """
+        Allocates the buffers of the kernel for num_inputs inputs. The window
+        size filter_size is not used.
+        """
+        self.state = np.zeros(num_inputs)
+        self.delta = np.zeros(num_inputs)
+        self.initialized = False
+
+    def reset(self):
+        """
+        Resets the state of the kernel in place.
+        """
+        self.state.fill(0)
+        self.initialized = False
+
+    def observe(self, new_values):
+        """
+        Blends the newest values of all inputs into the smoothed values.
+        """
+        if self.initialized:
+            np.subtract(new_values, self.state, out=self.delta)
+            self.delta *= self.alpha
+            self.state += self.delta
+        else:
+            np.copyto(self.state, new_values)
+            self.initialized = True
+
+    def compute(self, window, output):
+        """
+        Stores the smoothed values in output. The window is not used.
+        """
+        np.copyto(output, self.state)
+
+class KalmanKernel:
+    """
+    Kernel class that runs a scalar Kalman filter on each input, modelling
+    the underlying value (such as a TTC-related quantity) as a random walk
+    observed with noise.
+    """
+    def __init__(self, process_noise=1e-3, measurement_noise=1e-2):
+        """
+        Constructor for KalmanKernel, where the optional parameter
+        process_noise (with default value 1e-3) is the variance by which the
+        underlying value is expected to change between updates, and the
+        optional parameter measurement_noise (with default value 1e-2) is the
+        variance of the noise on each value.
+        """
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+
+    def allocate(self, num_inputs, filter_size):
+        """
+        Allocates the buffers of the kernel for num_inputs inputs. The window
+        size filter_size is not used.
+        """
+        self.state = np.zeros(num_inputs)
+        self.variance = np.zeros(num_inputs)
+        self.gain = np.zeros(num_inputs)
+        self.delta = np.zeros(num_inputs)
+        self.initialized = False
+
+    def reset(self):
+        """
+        Resets the state of the kernel in place.
+        """
+        self.state.fill(0)
+        self.variance.fill(0)
+        self.initialized = False
+
+    def observe(self, new_values):
+        """
+        Runs the predict and update steps of the Kalman filter with the
+        newest values of all inputs.
+        """
+        if not self.initialized:
+            np.copyto(self.state, new_values)
+            self.variance.fill(self.measurement_noise)
+            self.initialized = True
+            return
+
+        # Predict
+        self.variance += self.process_noise
+
+        # Update
+        np.add(self.variance, self.measurement_noise, out=self.gain)
+        np.divide(self.variance, self.gain, out=self.gain)
+        np.subtract(new_values, self.state, out=self.delta)
+        self.delta *= self.gain
+        self.state += self.delta
+        np.multiply(self.variance, self.gain, out=self.delta)
+        self.variance -= self.delta
+
+    def compute(self, window, output):
+        """
+        Stores the estimated values in output. The window is not used.
+        """
+        np.copyto(output, self.state)
+
+class FilterBank(object):
+    """
+    Class for filtering multiple inputs with a common kernel.
+    """
+    def __init__(self, num_inputs, kernel, filter_size=5, sliding=False):
+        """
+        Constructor for FilterBank, where num_inputs is the number of inputs
+        that the filter expects, kernel is the kernel that does the filtering,
+        the optional parameter filter_size (with default value 5) is the size
+        of the filter window, and the optional parameter sliding (with default
+        value False) determines whether the window slides, producing a result
+        on every update once the window is full, instead of covering
+        consecutive blocks of filter_size values.
+        """
+        self.num_inputs = num_inputs
+        self.kernel = kernel
+        self.filter_size = filter_size
+        self.sliding = sliding
+        self.window = np.zeros((num_inputs, filter_size))
+        self.output = np.zeros(num_inputs)
+        self.kernel.allocate(num_inputs, filter_size)
+        self.reset_filter()
+
+    def reset_filter(self):
+        """
+        Resets the entire state of the filter. No memory is allocated, so
+        this can be done after every block of values.
+        """
+        self.filter_state = 0
+        self.write_index = 0
+        self.kernel.reset()
+
+    def set_filter_value(self, input_index, new_value):
+        """
+        Sets a filter value for a particular input in a particular state, where
+        input_index is the index representing a particular input, and new_value
+        is the value for the input.
+        """
+        self.window[input_index, self.write_index] = new_value
+
+    def set_filter_values(self, new_values):
+        """
+        Sets all filter values for a particular state, where new_values is an
+        array of values for all the corresponding inputs.
+        """
+        self.window[:, self.write_index] = new_values
+
+    def update_filter(self):
+        """
+        Updates the state of the filter. If all data have been retrieved, the
+        filtered value for each input is computed and an array corresponding
+        to the filtered values is returned. Otherwise, None is returned.
+        Without a sliding window, the state of the filter is then reset for
+        next time. The returned array is reused by the next update.
+        """
+        result = None
+        self.kernel.observe(self.window[:, self.write_index])
+        self.filter_state += 1
+        self.write_index = (self.write_index + 1) % self.filter_size
+        if self.filter_state >= self.filter_size:
+            self.kernel.compute(self.window, self.output)
+            result = self.output
+            if not self.sliding:
+                self.reset_filter()
+        return result
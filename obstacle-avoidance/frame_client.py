@@ -22,6 +22,8 @@ class FrameClient:
         """
         self.s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.s.connect((host, port))
+        self.reader = socket_util.SocketReader(self.s)
+        self.frame_buffer = bytearray()
     
     def get_frame(self):
         """
@@ -29,10 +31,11 @@ class FrameClient:
         representation understandable by OpenCV, which is returned by the
         function. In the case of an error, None is returned.
         """
-        message = socket_util.recv_msg_as_base64(self.s)
-        if message is None:
+        msglen = self.reader.recv_msg_into(self.frame_buffer)
+        if msglen is None:
             return None
-        return cv2.imdecode(np.fromstring(message, dtype=np.uint8), 1)
+        return cv2.imdecode(np.frombuffer(self.frame_buffer, dtype=np.uint8, \
+                                          count=msglen), 1)
 
     def shutdown(self):
         """
@@ -0,0 +1,187 @@
+"""
+This module implements a JPEG encoding stage for image frames, which runs in
+its own thread so that encoding does not take time away from the obstacle
+avoider. Only the most recent frame waits to be encoded; older frames are
+skipped if the encoder falls behind.
+
+Frames can be downscaled before encoding, and both the JPEG quality and the
+scale can be adapted automatically. They are lowered when encoding takes
+longer than the time budget or when clients cannot keep up with the frames,
+and raised again (scale first) when there is time to spare.
+"""
+
+__author__ = "Ron Wright"
+__copyright__ = "Copyright 2015 Ronald Joseph Wright"
+__maintainer__ = "Ron Wright"
+
+from threading import Condition, Thread
+import cv2
+import time
+
+# OpenCV 2.x only exposes the flag under cv2.cv, but the value is the same
+IMWRITE_JPEG_QUALITY = getattr(cv2, 'IMWRITE_JPEG_QUALITY', 1)
+
+class FrameEncoder:
+    """
+    Class for encoding image frames into JPEG format in a separate thread.
+    """
+    def __init__(self, deliver_func, quality=80, scale=1.0, adaptive=True, \
+                 time_budget=0.02, congestion_func=None):
+        """
+        Constructor for FrameEncoder, where deliver_func is the function that
+        is called from the encoder thread with each encoded frame, as follows:
+
+           deliver_func(jpeg, *args)
+
+        where jpeg is the JPEG data, and args are the extra arguments given
+        along with the frame. The optional parameter quality (with default
+        value 80) is the JPEG quality (0 to 100), the optional parameter scale
+        (with default value 1.0) is the factor by which frames are resized
+        before encoding, and the optional parameter adaptive (with default
+        value True) determines whether the quality and the scale are adapted
+        automatically, in which case quality and scale are the highest values
+        used. The optional parameter time_budget (with default value 0.02) is
+        the time (in seconds) that encoding a frame should take at most, and
+        the optional parameter congestion_func (with default value None) is a
+        function without arguments that returns whether clients have failed
+        to keep up with the frames since it was last called.
+        """
+        self.deliver_func = deliver_func
+        self.max_quality = quality
+        self.max_scale = scale
+        self.quality = quality
+        self.scale = scale
+        self.adaptive = adaptive
+        self.time_budget = time_budget
+        self.congestion_func = congestion_func
+
+        # Lower bounds and steps for adapting the quality and the scale
+        self.min_quality = min(30, quality)
+        self.quality_step = 5
+        self.min_scale = min(0.25, scale)
+        self.scale_step = 0.8
+
+        self.pending = None
+        self.num_skipped = 0
+        self.scaled_frame = None
+        self.running = False
+        self.cv = Condition()
+        self.thread = None
+
+    def start(self):
+        """
+        Starts the encoder thread.
+        """
+        self.running = True
+        self.thread = Thread(target=self.encode_frames)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops the encoder thread and waits for it to finish.
+        """
+        self.cv.acquire()
+        self.running = False
+        self.cv.notify_all()
+        self.cv.release()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def submit(self, the_frame, *args):
+        """
+        Hands the image frame the_frame over to the encoder thread, along with
+        the extra arguments args for the deliver function. A frame that is
+        still waiting to be encoded is replaced. The frame must not be
+        modified afterwards.
+        """
+        self.cv.acquire()
+        if self.pending is not None:
+            self.num_skipped += 1
+        self.pending = (the_frame, args)
+        self.cv.notify_all()
+        self.cv.release()
+
+    def get_settings(self):
+        """
+        Returns the current JPEG quality and scale as a pair.
+        """
+        return self.quality, self.scale
+
+    def get_skipped_frame_count(self):
+        """
+        Returns the number of frames that were replaced by newer frames before
+        they could be encoded.
+        """
+        return self.num_skipped
+
+    def resize_frame(self, the_frame):
+        """
+        Helper function that resizes the_frame by the current scale, reusing
+        the buffer for the resized frame if possible. This function should not
+        be used directly outside this class.
+        """
+        if self.scale == 1.0:
+            return the_frame
+        rows, columns = the_frame.shape[:2]
+        size = (max(1, int(round(columns * self.scale))), \
+                max(1, int(round(rows * self.scale))))
+        if self.scaled_frame is None or \
+           self.scaled_frame.shape[1::-1] != size or \
+           self.scaled_frame.shape[2:] != the_frame.shape[2:]:
+            self.scaled_frame = cv2.resize(the_frame, size, \
+                                           interpolation=cv2.INTER_AREA)
+        else:
+            cv2.resize(the_frame, size, dst=self.scaled_frame, \
+                       interpolation=cv2.INTER_AREA)
+        return self.scaled_frame
+
+    def adapt(self, encode_time):
+        """
+        Helper function that adapts the JPEG quality and the scale, given the
+        time encode_time (in seconds) that encoding the last frame took. The
+        quality is lowered before the scale, and the scale is raised before
+        the quality. This function should not be used directly outside this
+        class.
+        """
+        congested = self.congestion_func is not None and \
+                    self.congestion_func()
+        if congested or encode_time > self.time_budget:
+            if self.quality > self.min_quality:
+                self.quality = max(self.min_quality, \
+                                   self.quality - self.quality_step)
+            elif self.scale > self.min_scale:
+                self.scale = max(self.min_scale, self.scale * self.scale_step)
+        elif encode_time < 0.5 * self.time_budget:
+            if self.scale < self.max_scale:
+                self.scale = min(self.max_scale, self.scale / self.scale_step)
+            elif self.quality < self.max_quality:
+                self.quality = min(self.max_quality, \
+                                   self.quality + self.quality_step)
+
+    def encode_frames(self):
+        """
+        Encoder thread function that encodes frames as they come in until the
+        encoder is stopped. This function should not be used directly outside
+        this class.
+        """
+        while True:
+            self.cv.acquire()
+            while self.pending is None and self.running:
+                self.cv.wait()
+            if not self.running:
+                self.cv.release()
+                break
+            the_frame, args = self.pending
+            self.pending = None
+            self.cv.release()
+
+            start_time = time.time()
+            ret_val, buf = cv2.imencode('.jpg', self.resize_frame(the_frame), \
+                                        [IMWRITE_JPEG_QUALITY, self.quality])
+            encode_time = time.time() - start_time
+            if self.adaptive:
+                self.adapt(encode_time)
+            if ret_val:
+                self.deliver_func(buf.tobytes(), *args)
@@ -1,6 +1,7 @@
 """
 This module implements a server that sends frames to connected clients in
-real time.
+real time. Frames are encoded into JPEG format by a FrameEncoder in its own
+thread, which can also be shared with other servers.
 """
 
 __author__ = "Ron Wright"
@@ -8,27 +9,65 @@ __copyright__ = "Copyright 2015 Ronald Joseph Wright"
 __maintainer__ = "Ron Wright"
 
 from push_server import PushServer
-import cv2
+from frame_encoder import FrameEncoder
 
 class FrameServer(PushServer):
     """
     Class for sending image frames to clients in real time
     """
-    def __init__(self, port=11111, backlog=5):
+    def __init__(self, port=11111, backlog=5, max_lag=None, quality=80, \
+                 scale=1.0, adaptive=True, encode_frames=True):
         """
         Constructor for FrameServer, where the optional parameter port (with
         default value 11111) is the port number to use for the frame server,
-        and the optional parameter backlog (with default value 5) is the
-        maximum number of incoming client connections that can wait between
-        successive accept calls.
+        the optional parameter backlog (with default value 5) is the maximum
+        number of incoming client connections that can wait between
+        successive accept calls, and the optional parameter max_lag (with
+        default value None) is the number of frames that can be dropped in a
+        row for a client before it is disconnected (or None if clients are
+        never disconnected for lagging). Only the most recent frame is sent to
+        each client. The optional parameters quality (with default value 80),
+        scale (with default value 1.0) and adaptive (with default value True)
+        are the JPEG quality, the factor by which frames are resized, and
+        whether both are adapted automatically (see FrameEncoder). If the
+        optional parameter encode_frames (with default value True) is False,
+        the server does not have an encoder of its own, and frames that are
+        already encoded must be sent with push_encoded_frame instead of
+        push_frame.
         """
-        super(FrameServer, self).__init__(port, backlog)
+        super(FrameServer, self).__init__(port, backlog, max_lag=max_lag)
+        self.num_dropped_frames = 0
+        self.encoder = None
+        if encode_frames:
+            self.encoder = FrameEncoder(self.push_encoded_frame, quality, \
+                                        scale, adaptive, \
+                                        congestion_func=self.is_congested)
+            self.encoder.start()
+
+    def is_congested(self):
+        """
+        Returns whether any frames were dropped for clients since the last
+        call, which can be used as the congestion function of a FrameEncoder.
+        """
+        num_dropped = self.get_dropped_count()
+        congested = num_dropped > self.num_dropped_frames
+        self.num_dropped_frames = num_dropped
+        return congested
 
     def push_frame(self, the_frame):
         """
         Sets the frame to be sent to connected clients. Clients are notified
-        only when the frame is valid.
+        only when the frame is valid. The frame is not encoded if no clients
+        are connected. The frame is encoded in the encoder thread, so it must
+        not be modified afterwards.
+        """
+        if not self.has_clients():
+            return
+        self.encoder.submit(the_frame)
+
+    def push_encoded_frame(self, jpeg):
+        """
+        Sends the JPEG data jpeg of a frame that has already been encoded to
+        connected clients.
         """
-        ret_val, buf = cv2.imencode('.jpg', the_frame)
-        if ret_val:
-            super(FrameServer, self).push_message(buf.tostring())
+        self.push_message(jpeg)
@@ -8,7 +8,12 @@ __copyright__ = "Copyright 2015 Ronald Joseph Wright"
 __maintainer__ = "Ron Wright"
 
 import threading
-from median_filter import MedianFilter
+import traceback
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+import cv2
 import numpy as np
 from scipy.spatial import Delaunay
 from scipy.spatial.qhull import QhullError
@@ -17,48 +22,86 @@ class FrameWorker:
     """
     Class with worker routines that are used for the obstacle avoider.
     """
-    def __init__(self, the_thread, frame_gray, last_iter_time, \
-        old_ttc_update_time, good_old, good_new):
+    def __init__(self, the_thread, the_frame, frame_shape, frame_time, \
+        old_frame_time, good_old, good_new, frame_number=0):
         """
-        Constructor for FrameWorker, where frame_gray is the grayscale image
-        frame, old_ttc_update_time is the most recent TTC update time (in
-        UNIX seconds), good_old is the filtered set of good feature points
-        from the previous iteration, and good_new is the filtered set of good
-        feature points from the current iteration.
+        Constructor for FrameWorker, where the_frame is the color image frame
+        (or None if the frame is not to be rendered), frame_shape is the shape
+        (rows and columns) of the image frame that the feature point
+        coordinates refer to, frame_time is the capture time of the frame (in
+        seconds), old_frame_time is the capture time of the frame from the
+        previous iteration, good_old is the filtered set of good feature
+        points from the previous iteration, good_new is the filtered set of
+        good feature points from the current iteration, and the optional
+        parameter frame_number (with default value 0) is the number of the
+        frame.
         """
         self.the_thread = the_thread
-        self.frame_gray = frame_gray
-        self.last_iter_time = last_iter_time
-        self.old_ttc_update_time = old_ttc_update_time
-        self.new_ttc_update_time = self.old_ttc_update_time
+        self.the_frame = the_frame
+        self.frame_shape = frame_shape
+        self.frame_time = frame_time
+        self.frame_number = frame_number
+        self.old_frame_time = old_frame_time
         self.good_old = good_old
         self.good_new = good_new
-        self.updated_mask = None
+        self.rendered_frame = None
+        self.lost_tracking = False
         self.min_ttc = None
         self.left_ttc = None
         self.right_ttc = None
-        self.t1 = None
-        self.t2 = None
+        self.zone_ttcs = None
+        self.ttc_done = threading.Event()
+        self.render_done = threading.Event()
 
     @staticmethod
-    def find_neighborhoods(delaunay_triangles):
+    def find_edges(delaunay_triangles):
         """
         Helper function used internally by the TTC computation algorithm for
-        finding nearby feature points corresponding to a particular feature
-        point. This function should not be used directly outside this class.
-        """
-        neighbor_dict = {}
-        for triangle_point_indices in delaunay_triangles:
-            index_set = set(triangle_point_indices)
-            for index in index_set:
-                index_set_2 = index_set - set([index])
-                if len(index_set_2) != 0:
-                    if neighbor_dict.get(index):
-                        neighbor_dict[index] = neighbor_dict[index] | \
-                                               index_set_2
-                    else:
-                        neighbor_dict[index] = index_set_2
-        return neighbor_dict
+        finding the unique edges of the Delaunay triangulation. Two arrays are
+        returned, the first holding the lower point index of each edge and the
+        second holding the higher point index. This function should not be
+        used directly outside this class.
+        """
+        triangles = np.asarray(delaunay_triangles)
+        num_points = triangles.max() + 1
+        edges = np.concatenate((triangles[:, [0, 1]], triangles[:, [1, 2]], \
+                                triangles[:, [2, 0]]))
+        edges.sort(axis=1)
+        # Encode each edge as a single integer so duplicates shared by
+        # adjacent triangles can be removed with a 1D unique
+        keys = np.unique(edges[:, 0] * num_points + edges[:, 1])
+        return keys // num_points, keys % num_points
+
+    @staticmethod
+    def compute_local_scales(old_points, new_points, delaunay_triangles):
+        """
+        Helper function used internally by the TTC computation algorithm for
+        computing the local scale change of every feature point relative to
+        the feature points in its Delaunay neighborhood. The edge lengths are
+        computed once per edge and summed per feature point in a single pass.
+        A pair is returned containing the indices of the feature points with
+        a valid local scale and the corresponding local scales. This function
+        should not be used directly outside this class.
+        """
+        first, second = FrameWorker.find_edges(delaunay_triangles)
+        num_points = len(new_points)
+
+        old_lengths = np.linalg.norm(old_points[first] - old_points[second], \
+                                     axis=1)
+        new_lengths = np.linalg.norm(new_points[first] - new_points[second], \
+                                     axis=1)
+
+        # Each edge contributes its length to both of its end points
+        old_sums = \
+            np.bincount(first, weights=old_lengths, minlength=num_points) + \
+            np.bincount(second, weights=old_lengths, minlength=num_points)
+        new_sums = \
+            np.bincount(first, weights=new_lengths, minlength=num_points) + \
+            np.bincount(second, weights=new_lengths, minlength=num_points)
+
+        indices = np.flatnonzero(new_sums != 0)
+        new_sums = new_sums[indices]
+        return indices, (old_sums[indices] - new_sums) / new_sums
 
     @staticmethod
     def filter_local_scales(local_scales, num_localscales, threshold=None):
@@ -79,38 +122,57 @@ class FrameWorker:
             max_local_scale = np.max(thresh_scales)
         return the_threshold, max_local_scale, thresh_scales
 
-    def start(self):
+    @staticmethod
+    def find_zone_max_scales(points, local_scales, zone_area, zone_grid, \
+        threshold):
         """
-        Starts the TTC computation and rendering threads.
+        Helper function used internally by the TTC computation algorithm for
+        finding the max local scale in each zone of a grid laid over part of
+        the frame, where points are the feature points the local scales belong
+        to, zone_area is the rectangle (x, y, width, height) covered by the
+        grid, and zone_grid is a pair containing the number of rows and
+        columns of the grid. Local scales below threshold are ignored, and the
+        max local scale of a zone without any remaining local scales is 0.
+        This function should not be used directly outside this class.
         """
-        # Start TTC computation function as a thread
-        self.t1 = threading.Thread(target=self.ttc_computation_function)
-        self.t1.daemon = True
-        self.t1.start()
-        # Start image/optical flow rendering function as a thread
-        self.t2 = threading.Thread(target=self.rendering_function)
-        self.t2.daemon = True
-        self.t2.start()
+        rows, columns = zone_grid
+        x, y, width, height = zone_area
+        row = np.clip(((points[:, 1] - y) * rows / height).astype(int), \
+                      0, rows - 1)
+        column = np.clip(((points[:, 0] - x) * columns / width).astype(int), \
+                         0, columns - 1)
+        zone_max_scales = np.full(rows * columns, -np.inf)
+        np.maximum.at(zone_max_scales, row * columns + column, local_scales)
+        zone_max_scales[zone_max_scales < threshold] = 0
+        return zone_max_scales
+
+    def start(self, pool):
+        """
+        Queues the TTC computation and rendering on the worker threads of the
+        given FrameWorkerPool.
+        """
+        pool.submit(self)
 
     def wait_on_ttc_computation(self):
         """
-        Waits for the TTC computation thread to finish.
+        Waits for the TTC computation to finish.
         """
-        self.t1.join()
+        self.ttc_done.wait()
 
     def wait_on_render(self):
         """
-        Waits for the rendering thread to finish.
+        Waits for the rendering to finish.
         """
-        self.t2.join()
+        self.render_done.wait()
 
     def ttc_computation_function(self):
         """
         TTC computation thread function that computes the overall TTC, left
-        TTC, and right TTC.
+        TTC, and right TTC, as well as the TTC of each zone if a zone grid is
+        set.
         """
         the_thread = self.the_thread
-        frame_gray = self.frame_gray
+        frame_shape = self.frame_shape
         good_old = self.good_old
         good_new = self.good_new
 
@@ -121,40 +183,24 @@ class FrameWorker:
         num_localscales = 0
         num_left_scales = 0
         num_right_scales = 0
+        local_scales = np.zeros(0)
+        scale_points = np.zeros((0, 2))
         if len(good_old) >= 4:
             try:
                 old_triangles = Delaunay(good_old).simplices
-                neighborhoods = FrameWorker.find_neighborhoods( \
-                    old_triangles)
-                for (k, v) in list(neighborhoods.items()):
-                    index_arr = np.array(list(v))
-
-                    # target point
-                    new_point = good_new[k]
-                    old_point = good_old[k]
-
-                    # neighborhood points
-                    new_neighborhood = good_new[index_arr]
-                    old_neighborhood = good_old[index_arr]
-
-                    sum2 = np.sum(np.linalg.norm( \
-                        new_point - new_neighborhood, axis=1))
-                    if sum2 != 0:
-                        sum1 = np.sum(np.linalg.norm( \
-                            old_point - old_neighborhood, axis=1))
-                        local_scale = (sum1 - sum2) / sum2
-
-                        if (2*new_point[0]) < np.shape(frame_gray)[0]:
-                            the_thread.left_scales[num_left_scales] = \
-                                local_scale
-                            num_left_scales += 1
-                        else:
-                            the_thread.right_scales[num_right_scales] = \
-                                local_scale
-                            num_right_scales += 1
-
-                        the_thread.local_scales[num_localscales] = local_scale
-                        num_localscales += 1
+                indices, local_scales = FrameWorker.compute_local_scales( \
+                    good_old, good_new, old_triangles)
+                scale_points = good_new[indices]
+                is_left = (2*scale_points[:, 0]) < frame_shape[1]
+                left_scales = local_scales[is_left]
+                right_scales = local_scales[~is_left]
+
+                num_localscales = len(local_scales)
+                num_left_scales = len(left_scales)
+                num_right_scales = len(right_scales)
+                the_thread.local_scales[:num_localscales, 0] = local_scales
+                the_thread.left_scales[:num_left_scales, 0] = left_scales
+                the_thread.right_scales[:num_right_scales, 0] = right_scales
             except (QhullError, ValueError):
                 pass
 
@@ -163,11 +209,14 @@ class FrameWorker:
             FrameWorker.filter_local_scales( \
                 the_thread.local_scales, num_localscales)
 
+        # Find time between the two frames
+        delta = self.frame_time - self.old_frame_time
+
         if len(thresh_scales) == 0:
-            # We lost sufficient information at this point; reinitialize
-            # the obstacle avoider
-            the_thread.old_gray = None
-        else:
+            # We lost sufficient information at this point; the obstacle
+            # avoider needs more feature points
+            self.lost_tracking = True
+        elif delta > 0:
             # Find max local scale on left half of screen
             _, left_max_scale, _ = \
                 FrameWorker.filter_local_scales( \
@@ -180,49 +229,70 @@ class FrameWorker:
                     the_thread.right_scales, num_right_scales, \
                     threshold=threshold)
 
-            # Find maximum in each set of thresholded local scales
+            # Find maximum in each set of thresholded local scales, turned
+            # into a rate of scale change so that frames captured at uneven
+            # intervals can be filtered together
             the_thread.scale_filter.set_filter_values( \
-                (max_scale, left_max_scale, right_max_scale))
+                (max_scale / delta, left_max_scale / delta, \
+                 right_max_scale / delta))
             medians = the_thread.scale_filter.update_filter()
 
             if medians is not None:
-                # Find median of each maximum local scale
-                median_max_scale, left_median_max_scale, \
-                                  right_median_max_scale = medians
-
-                # Find change in time, keeping in mind that we must
-                # compensate for median filtering.
-                self.new_ttc_update_time = self.last_iter_time
-                delta = (self.new_ttc_update_time - self.old_ttc_update_time) \
-                    / the_thread.scale_filter.filter_size
-
-                self.min_ttc = float('inf') if median_max_scale == 0 \
-                                else delta / median_max_scale
-                self.left_ttc = float('inf') if left_median_max_scale == 0 \
-                           else delta / left_median_max_scale
-                self.right_ttc = float('inf') if right_median_max_scale == 0 \
-                            else delta / right_median_max_scale
+                # Find median of each maximum local scale rate
+                median_max_rate, left_median_max_rate, \
+                                 right_median_max_rate = medians
+
+                self.min_ttc = float('inf') if median_max_rate == 0 \
+                                else 1.0 / median_max_rate
+                self.left_ttc = float('inf') if left_median_max_rate == 0 \
+                           else 1.0 / left_median_max_rate
+                self.right_ttc = float('inf') if right_median_max_rate == 0 \
+                            else 1.0 / right_median_max_rate
+
+            if the_thread.zone_grid is not None:
+                # Find max local scale in each zone of the region of interest,
+                # or of the screen if there is none
+                zone_area = the_thread.roi
+                if zone_area is None:
+                    zone_area = (0, 0, frame_shape[1], frame_shape[0])
+                zone_max_scales = FrameWorker.find_zone_max_scales( \
+                    scale_points, local_scales, zone_area, \
+                    the_thread.zone_grid, threshold)
+                zone_max_scales /= delta
+                the_thread.zone_filter.set_filter_values(zone_max_scales)
+                zone_medians = the_thread.zone_filter.update_filter()
+
+                if zone_medians is not None:
+                    with np.errstate(divide='ignore'):
+                        zone_ttcs = np.where(zone_medians == 0, np.inf, \
+                                             1.0 / zone_medians)
+                    self.zone_ttcs = zone_ttcs.reshape(the_thread.zone_grid)
 
     def rendering_function(self):
         """
         Rendering function that draws optical flow tracks on top of the image.
         """
         # Draw the tracks
-        self.the_thread.drawer.draw_tracks(self.good_old, self.good_new)
-        self.updated_mask = self.the_thread.drawer.get_current_mask()
-        self.the_thread.drawer.update_frame_state()
+        drawer = self.the_thread.drawer
+        drawer.set_frame(self.the_frame)
+        drawer.draw_tracks(self.good_old, self.good_new)
+        cv2.add(self.the_frame, drawer.get_current_mask(), dst=self.the_frame)
+        self.rendered_frame = self.the_frame
+        drawer.update_frame_state()
 
-    def get_updated_mask(self):
+    def get_rendered_frame(self):
         """
-        Getter for retrieving the most recently updated mask.
+        Getter for retrieving the image with the optical flow tracks drawn on
+        top of it, or None if the frame was not rendered.
         """
-        return self.updated_mask
+        return self.rendered_frame
 
-    def get_latest_ttc_update_time(self):
+    def has_lost_tracking(self):
         """
-        Getter for retrieving the most recent TTC update time.
+        Getter that returns whether there were too few usable feature points
+        to compute the TTC values.
         """
-        return self.new_ttc_update_time
+        return self.lost_tracking
 
     def get_ttc_values(self):
         """
@@ -231,3 +301,96 @@ class FrameWorker:
         values will be None.
         """
         return self.min_ttc, self.left_ttc, self.right_ttc
+
+    def get_zone_ttc_values(self):
+        """
+        Getter that returns an array with the TTC value of each zone, with
+        one row per row of zones and one column per column of zones. If no
+        zone grid is set or the median filter is not finished processing,
+        None is returned.
+        """
+        return self.zone_ttcs
+
+class FrameWorkerPool:
+    """
+    Class with long-lived threads that run the TTC computation and rendering
+    work of FrameWorker objects. Each kind of work has its own queue and
+    thread, so frames are processed in the order they were submitted, and the
+    rendering of one frame can overlap with the processing of the next one.
+    """
+    def __init__(self, ttc_process=None):
+        """
+        Constructor for FrameWorkerPool. It starts the TTC computation and
+        rendering threads. If the optional parameter ttc_process (with default
+        value None) is given, the TTC computations are handed over to that
+        TTCProcess instead of being done in this process.
+        """
+        self.ttc_process = ttc_process
+        self.ttc_queue = Queue()
+        self.render_queue = Queue()
+        self.threads = []
+        for the_queue in (self.ttc_queue, self.render_queue):
+            t = threading.Thread(target=FrameWorkerPool.process_queue, \
+                                 args=(the_queue,))
+            t.daemon = True
+            t.start()
+            self.threads.append(t)
+
+    @staticmethod
+    def process_queue(the_queue):
+        """
+        Worker thread function that runs queued tasks until it receives None.
+        This function should not be used directly outside this class.
+        """
+        while True:
+            item = the_queue.get()
+            if item is None:
+                break
+            task, done = item
+            try:
+                task()
+            except Exception:
+                # Keep the thread alive for the frames that follow
+                traceback.print_exc()
+            finally:
+                done.set()
+
+    def submit(self, worker):
+        """
+        Queues the TTC computation and rendering of the FrameWorker worker.
+        Nothing is rendered if the worker has no frame.
+        """
+        if self.ttc_process is None:
+            ttc_task = worker.ttc_computation_function
+        else:
+            ttc_task = lambda: self.ttc_process.compute(worker)
+        self.ttc_queue.put((ttc_task, worker.ttc_done))
+        if worker.the_frame is None:
+            worker.render_done.set()
+        else:
+            self.render_queue.put((worker.rendering_function, \
+                                   worker.render_done))
+
+    def reset_filters(self, filters):
+        """
+        Resets the state of the filters used for the TTC computations, where
+        filters is the list of filters used when the TTC computations are done
+        in this process. Entries that are None are skipped.
+        """
+        if self.ttc_process is None:
+            for the_filter in filters:
+                if the_filter is not None:
+                    the_filter.reset_filter()
+        else:
+            self.ttc_process.reset_filters()
+
+    def shutdown(self):
+        """
+        Stops the worker threads once all queued work has been finished.
+        """
+        self.ttc_queue.put(None)
+        self.render_queue.put(None)
+        for t in self.threads:
+            t.join()
+        if self.ttc_process is not None:
+            self.ttc_process.shutdown()
@@ -2,12 +2,29 @@ import sys
 from obstacle_avoider import ObstacleAvoider
 from frame_server import FrameServer
 from ttc_server import TTCServer
+from telemetry_server import TelemetryServer
+from frame_encoder import FrameEncoder
 import threading
 import time
 
 def imgdisp(cv2, img):
 #    cv2.imshow('frame', img)
-    frame_server.push_frame(img)
+    frame_number, frame_time = avoider.get_frame_info()
+    encoder.submit(img, frame_number, frame_time)
+
+def push_encoded_frame(jpeg, frame_number, frame_time):
+    frame_server.push_encoded_frame(jpeg)
+    telemetry_server.push_encoded_frame(jpeg, frame_number, frame_time)
+
+def frames_congested():
+    # Both servers are asked so that they keep count of dropped frames
+    frame_server_congested = frame_server.is_congested()
+    telemetry_server_congested = telemetry_server.is_congested()
+    return frame_server_congested or telemetry_server_congested
+
+def display_needed():
+    return frame_server.has_clients() or \
+           telemetry_server.has_frame_clients()
 
 def min_ttc(the_min_ttc):
     global glob_min_ttc
@@ -15,24 +32,48 @@ def min_ttc(the_min_ttc):
     sys.stdout.flush()
     glob_min_ttc = the_min_ttc
 
+def zone_ttc(zone_ttcs):
+    global glob_zone_ttc
+    glob_zone_ttc = zone_ttcs
+    frame_number, frame_time = avoider.get_frame_info()
+    telemetry_server.push_zone_ttc_values(zone_ttcs, frame_number, frame_time)
+
 def balance_strategy(left_ttc, right_ttc):
     print("Left TTC: %g, Right TTC: %g"%(left_ttc, right_ttc))
     sys.stdout.flush()
-    ttc_server.push_ttc_values(glob_min_ttc, left_ttc, right_ttc)
+    frame_number, frame_time = avoider.get_frame_info()
+    ttc_server.push_ttc_values(glob_min_ttc, left_ttc, right_ttc, \
+                               glob_zone_ttc, frame_number, frame_time)
+    telemetry_server.push_ttc_values(glob_min_ttc, left_ttc, right_ttc, \
+                                     frame_number, frame_time)
 
 def main(argv):
-    global frame_server, ttc_server
+    global frame_server, ttc_server, telemetry_server, encoder, avoider, \
+           glob_zone_ttc
+
+    glob_zone_ttc = None
 
-    frame_server = FrameServer()
+    # The frame and TTC servers are used by the dashboard, while the
+    # telemetry server carries both over a single connection. Each frame is
+    # encoded once and sent to both servers
+    frame_server = FrameServer(encode_frames=False)
     ttc_server = TTCServer()
+    telemetry_server = TelemetryServer(encode_frames=False)
+    encoder = FrameEncoder(push_encoded_frame, \
+                           congestion_func=frames_congested)
+    encoder.start()
 
     frame_server.run_daemon_thread()
     ttc_server.run_daemon_thread()
+    telemetry_server.run_daemon_thread()
 
     avoider = ObstacleAvoider()
     avoider.set_imgdisp_cb(imgdisp)
+    avoider.set_display_needed_cb(display_needed)
     avoider.set_balance_strategy_cb(balance_strategy)
     avoider.set_min_ttc_cb(min_ttc)
+    avoider.set_zone_grid(4)
+    avoider.set_zone_ttc_cb(zone_ttc)
 
     print("\n")
     avoider.start()
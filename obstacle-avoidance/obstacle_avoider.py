@@ -23,12 +23,14 @@ __copyright__ = "Copyright 2015 Ronald Joseph Wright"
 __maintainer__ = "Ron Wright"
 
 from optical_flow_drawer import OpticalFlowDrawer
-from frame_worker import FrameWorker
+from frame_worker import FrameWorker, FrameWorkerPool
 from median_filter import MedianFilter
+from ttc_process import TTCProcess
 from threading import Thread
 import numpy as np
 import cv2
 from cameras.auto_camera import AutoCamera
+from cameras.frame_grabber import FrameGrabber
 import time
 from math import ceil
 
@@ -36,19 +38,31 @@ class ObstacleAvoiderThread(Thread):
     """
     Class for running the obstacle avoidance algorithm in a Python thread.
     """
-    def __init__(self):
+    def __init__(self, max_corners=100, use_process=False, \
+        latest_frame_only=True):
         """
         Constructor for ObstacleAvoiderThread. It sets up the parameters for
         camera snapshot retrieval as well as the parameters for optical flow
-        feature selection and time-to-collision (TTC) calculations.
+        feature selection and time-to-collision (TTC) calculations. The
+        optional parameter max_corners (with default value 100) is the maximum
+        number of feature points to track, the optional parameter use_process
+        (with default value False) determines whether TTC computations are
+        done in a separate process, and the optional parameter
+        latest_frame_only (with default value True) determines whether stale
+        camera frames are dropped in favor of the most recent one.
         """
         Thread.__init__(self)
 
-        # Initialize camera
+        self.use_process = use_process
+        self.ttc_process = None
+
+        # Initialize camera and the thread that captures its frames
         self.camera = AutoCamera()
+        self.grabber = FrameGrabber(self.camera, \
+                                    latest_only=latest_frame_only)
 
         # Parameters for Shi-Tomasi corner detection
-        self.feature_params = dict( maxCorners = 100,
+        self.feature_params = dict( maxCorners = max_corners,
                                     qualityLevel = 0.3,
                                     minDistance = 7,
                                     blockSize = 7 )
@@ -60,24 +74,237 @@ class ObstacleAvoiderThread(Thread):
                                            cv2.TERM_CRITERIA_COUNT, 10, 0.03) )
 
         # Initialize optical flow drawing class
-        self.drawer = OpticalFlowDrawer(100)
+        self.drawer = OpticalFlowDrawer(max_corners)
 
         # Create array for line equations
-        self.lines = np.zeros((100, 3))
-        self.local_scales = np.zeros((100, 1))
-        self.left_scales = np.zeros((100, 1))
-        self.right_scales = np.zeros((100, 1))
+        self.allocate_buffers(max_corners)
 
         # Median filtering for smoother TTC computations
-        self.scale_filter = MedianFilter(3)
+        self.scale_filter = MedianFilter(3, sliding=True)
+
+        # Grid of zones (rows and columns) with their own TTC values, along
+        # with the filter for the zones
+        self.zone_grid = None
+        self.zone_filter = None
 
         self.old_gray = None
         self.p0 = None
 
+        # Region of interest (x, y, width, height) and scale factor for
+        # processing, along with a buffer for the scaled frame
+        self.roi = None
+        self.processing_scale = 1.0
+        self.scaled_frame = None
+
+        # Grayscale frames are converted into these two buffers in turn, so
+        # that the previous frame stays intact while the current frame is
+        # processed
+        self.gray_buffers = [None, None]
+        self.gray_index = 0
+
+        # Number of frames between checks for missing feature points
+        self.replenish_interval = 10
+
+        # Maximum forward-backward tracking error (in pixels) for a feature
+        # point to be accepted, or None to accept all tracked feature points
+        self.fb_threshold = None
+        self.num_rejected_points = 0
+
         # Callbacks
         self.imgdisp_cb = None
         self.min_ttc_cb = None
         self.balance_strategy_cb = None
+        self.zone_ttc_cb = None
+        self.display_needed_cb = None
+
+        # Number and capture time of the camera snapshot that the callbacks
+        # refer to
+        self.frame_info = (0, None)
+
+    def allocate_buffers(self, capacity):
+        """
+        Helper function that allocates the line equation and local scale
+        buffers with room for capacity feature points. This function should
+        not be used directly outside this class.
+        """
+        self.lines = np.zeros((capacity, 3))
+        self.local_scales = np.zeros((capacity, 1))
+        self.left_scales = np.zeros((capacity, 1))
+        self.right_scales = np.zeros((capacity, 1))
+
+    def ensure_capacity(self, num_features):
+        """
+        Makes sure that the local scale buffers can hold num_features feature
+        points. The buffers are grown geometrically so that repeated growth
+        costs amortized constant time. This function should not be used
+        directly outside this class.
+        """
+        capacity = len(self.local_scales)
+        if num_features > capacity:
+            self.allocate_buffers(max(num_features, 2*capacity))
+
+    def set_max_corners(self, max_corners):
+        """
+        Setter for the maximum number of feature points to track. The new
+        value takes effect the next time corners are detected. If the TTC
+        computations are done in a separate process, the value is limited to
+        the maximum number of feature points at the time the process was
+        started.
+        """
+        if self.ttc_process is not None:
+            max_corners = min(max_corners, self.ttc_process.capacity)
+        self.feature_params['maxCorners'] = max_corners
+
+    def start_ttc_process(self):
+        """
+        Starts the separate process for TTC computations if one is used and
+        it is not running yet. Its shared memory buffers are sized for the
+        maximum number of feature points, so the process never needs to be
+        restarted.
+        """
+        if self.use_process and self.ttc_process is None:
+            self.ttc_process = TTCProcess()
+            self.ttc_process.start(self.feature_params['maxCorners'], self)
+
+    def set_decaying_trails(self, decaying):
+        """
+        Setter for whether the optical flow trails are drawn into a single
+        accumulator image that fades out, which uses less memory than the
+        default ring of trail layers. This function must be called before the
+        thread is started.
+        """
+        self.drawer.set_decaying(decaying)
+
+    def set_replenish_interval(self, replenish_interval):
+        """
+        Setter for the number of frames between attempts to replace lost
+        feature points with new ones. A value of 0 means that new feature
+        points are only looked for when there are too few of them to compute
+        the TTC values.
+        """
+        self.replenish_interval = replenish_interval
+
+    def replenish_features(self, frame_gray):
+        """
+        Helper function for run that looks for new corners in frame_gray to
+        make up for feature points that were lost. Corners are only looked for
+        away from the feature points that are still tracked, so those keep
+        their tracks. This function should not be used directly outside this
+        class.
+        """
+        num_missing = self.feature_params['maxCorners'] - len(self.p0)
+        if num_missing <= 0:
+            return
+
+        # Mask out the neighborhood of each tracked feature point. The frame
+        # is divided into cells of minDistance pixels, and the cells holding
+        # tracked feature points are marked together with the cells around
+        # them, which covers everything within minDistance of those points.
+        height, width = np.shape(frame_gray)
+        cell_size = max(1, int(self.feature_params['minDistance']))
+        rows = (height + cell_size - 1) // cell_size
+        columns = (width + cell_size - 1) // cell_size
+        cells = (self.p0.reshape(-1, 2) // cell_size).astype(int)
+        occupied = np.zeros((rows, columns), dtype=np.uint8)
+        occupied[np.clip(cells[:, 1], 0, rows - 1), \
+                 np.clip(cells[:, 0], 0, columns - 1)] = 255
+        occupied = cv2.dilate(occupied, np.ones((3, 3), dtype=np.uint8))
+        occupied = cv2.resize(occupied, \
+                              (columns * cell_size, rows * cell_size), \
+                              interpolation=cv2.INTER_NEAREST)
+        mask = cv2.bitwise_not(occupied[:height, :width])
+
+        feature_params = dict(self.feature_params, maxCorners=num_missing)
+        new_points = cv2.goodFeaturesToTrack(frame_gray, mask = mask, \
+                                             **feature_params)
+        if new_points is not None:
+            self.p0 = np.concatenate((self.p0, \
+                                      new_points.astype(self.p0.dtype)))
+
+    def set_forward_backward_threshold(self, fb_threshold):
+        """
+        Setter for the forward-backward consistency check. Each feature point
+        is tracked back from the new frame to the old one, and it is rejected
+        if it lands more than fb_threshold pixels away from where it started.
+        A value of None turns the check off.
+        """
+        self.fb_threshold = fb_threshold
+
+    def get_num_rejected_points(self):
+        """
+        Returns the number of feature points that the forward-backward
+        consistency check rejected in the most recent frame.
+        """
+        return self.num_rejected_points
+
+    def check_forward_backward(self, frame_gray, p1, good):
+        """
+        Helper function for run that performs the forward-backward consistency
+        check on the feature points p1 tracked into frame_gray, where good is
+        a boolean array that marks the feature points that were tracked
+        successfully. The updated boolean array is returned. This function
+        should not be used directly outside this class.
+        """
+        self.num_rejected_points = 0
+        p0r, st, _ = cv2.calcOpticalFlowPyrLK(frame_gray, self.old_gray, p1, \
+                                              None, **self.lk_params)
+        if p0r is None:
+            return good
+        diff = (self.p0 - p0r).reshape(-1, 2)
+        fb_error = np.hypot(diff[:, 0], diff[:, 1])
+        checked = good & (st.ravel() == 1) & (fb_error < self.fb_threshold)
+        self.num_rejected_points = np.count_nonzero(good & ~checked)
+        return checked
+
+    def set_scale_filter(self, scale_filter):
+        """
+        Setter for the filter used for smoother TTC computations, which must
+        be a FilterBank with three inputs (for the whole snapshot, the left
+        half, and the right half). This function must be called before the
+        thread is started.
+        """
+        self.scale_filter = scale_filter
+
+    def set_zone_grid(self, columns, rows=1):
+        """
+        Setter for the grid of zones that each get their own TTC value, where
+        columns is the number of columns of zones, and the optional parameter
+        rows (with default value 1) is the number of rows of zones. The zones
+        cover the region of interest, or the entire frame if there is none. A
+        value of None for columns turns the zones off. This function must be
+        called before the thread is started.
+        """
+        if columns is None:
+            self.zone_grid = None
+            self.zone_filter = None
+        else:
+            self.zone_grid = (rows, columns)
+            self.zone_filter = MedianFilter(rows * columns, sliding=True)
+
+    def get_frame_info(self):
+        """
+        Returns a pair containing the number and the capture time (in seconds)
+        of the camera snapshot that the callback being called refers to. This
+        allows TTC values to be matched with the image they were computed
+        from, since images are displayed one snapshot later. This function is
+        meant to be called from within the callbacks.
+        """
+        return self.frame_info
+
+    def set_display_needed_cb(self, display_needed_cb):
+        """
+        Setter for the display needed callback, which is called for each
+        camera snapshot to find out whether anybody is watching. If it returns
+        False, the optical flow tracks are not rendered and the image display
+        callback is not called, which saves the work of drawing and encoding
+        images that nobody sees. display_needed_cb takes on the following
+        format:
+
+           display_needed_cb()
+
+        By default, every snapshot is rendered and displayed.
+        """
+        self.display_needed_cb = display_needed_cb
 
     def set_imgdisp_cb(self, imgdisp_cb):
         """
@@ -119,6 +346,21 @@ class ObstacleAvoiderThread(Thread):
         """
         self.balance_strategy_cb = balance_strategy_cb
 
+    def set_zone_ttc_cb(self, zone_ttc_cb):
+        """
+        Setter for the zone TTC callback, which is called when the computation
+        of the minimum TTC value for each zone of a particular camera snapshot
+        has finished. It is called before the balance strategy callback, and
+        only if a zone grid is set. zone_ttc_cb takes on the following format:
+
+           zone_ttc_cb(zone_ttcs)
+
+        where zone_ttcs is a NumPy array with the minimum TTC value of each
+        zone, with one row per row of zones and one column per column of
+        zones.
+        """
+        self.zone_ttc_cb = zone_ttc_cb
+
     @staticmethod
     def find_neighborhoods(delaunay_triangles):
         """
@@ -158,6 +400,98 @@ class ObstacleAvoiderThread(Thread):
             max_local_scale = np.max(thresh_scales)
         return the_threshold, max_local_scale, thresh_scales
 
+    def set_roi(self, roi):
+        """
+        Setter for the region of interest, given as a tuple (x, y, width,
+        height) in pixels of the camera frame. Only this part of each frame
+        is used for feature detection and optical flow. A value of None means
+        that the entire frame is used. This function must be called before the
+        thread is started.
+        """
+        self.roi = roi
+
+    def set_processing_scale(self, processing_scale):
+        """
+        Setter for the factor by which the region of interest is scaled before
+        feature detection and optical flow, e.g. 0.5 to process frames at half
+        the resolution. This function must be called before the thread is
+        started.
+
+        Note that the parameters for feature detection and optical flow
+        (minDistance, blockSize and winSize) are given in processed pixels and
+        are not scaled along with the frames, so they cover a larger part of
+        the scene at smaller scales. Feature points are also tracked to a
+        coarser precision, which makes the local scales noisier, and since the
+        largest local scale is used for the minimum TTC, the TTC values are
+        biased low; at a scale of 0.5, the minimum TTC of a test sequence went
+        from about 4.4 to about 3.1 seconds.
+        """
+        self.processing_scale = processing_scale
+
+    def prepare_frame(self, the_frame):
+        """
+        Helper function for run that crops the_frame to the region of interest
+        and scales it for processing. This function should not be used
+        directly outside this class.
+        """
+        frame = the_frame
+        if self.roi is not None:
+            x, y, width, height = self.roi
+            frame = frame[y:y+height, x:x+width]
+        if self.processing_scale != 1.0:
+            height, width = np.shape(frame)[:2]
+            size = (int(round(width * self.processing_scale)), \
+                    int(round(height * self.processing_scale)))
+            if self.scaled_frame is None or \
+               np.shape(self.scaled_frame)[1::-1] != size:
+                self.scaled_frame = cv2.resize(frame, size, \
+                                               interpolation=cv2.INTER_AREA)
+            else:
+                cv2.resize(frame, size, dst=self.scaled_frame, \
+                           interpolation=cv2.INTER_AREA)
+            frame = self.scaled_frame
+        return frame
+
+    def to_frame_coordinates(self, points):
+        """
+        Helper function for run that maps feature points from the coordinates
+        used for processing back to camera frame coordinates. This function
+        should not be used directly outside this class.
+        """
+        if self.processing_scale != 1.0:
+            points = points / self.processing_scale
+        if self.roi is not None:
+            points = points + np.array(self.roi[:2], dtype=points.dtype)
+        return points
+
+    def convert_to_gray(self, the_frame):
+        """
+        Helper function for run that converts the_frame into grayscale,
+        writing into whichever grayscale buffer does not hold the previous
+        frame, and returns that buffer. This function should not be used
+        directly outside this class.
+        """
+        buffer = self.gray_buffers[self.gray_index]
+        if buffer is None or np.shape(buffer) != np.shape(the_frame)[:2]:
+            buffer = cv2.cvtColor(the_frame, cv2.COLOR_BGR2GRAY)
+            self.gray_buffers[self.gray_index] = buffer
+        else:
+            cv2.cvtColor(the_frame, cv2.COLOR_BGR2GRAY, dst=buffer)
+        self.gray_index = 1 - self.gray_index
+        return buffer
+
+    def display_render(self, worker):
+        """
+        Helper function for run that waits for the rendering of the given
+        worker to finish and displays the result. Nothing is done if worker is
+        None. This function should not be used directly outside this class.
+        """
+        if worker is not None:
+            worker.wait_on_render()
+            if worker.get_rendered_frame() is not None:
+                self.frame_info = (worker.frame_number, worker.frame_time)
+                self.imgdisp_cb(cv2, worker.get_rendered_frame())
+
     def run(self):
         """
         A function representing the thread runtime code. This function takes
@@ -170,27 +504,43 @@ class ObstacleAvoiderThread(Thread):
 
         This function should not be used directly outside this class.
         """
-        filter_update_time = None
-        for frame in self.camera.get_iterator():
+        self.start_ttc_process()
+        pool = FrameWorkerPool(self.ttc_process)
+        pending_worker = None
+        old_frame_time = None
+        frames_since_replenish = 0
+        rendering = True
+        frame_number = 0
+        self.grabber.start()
+        for the_frame, frame_time in self.grabber.get_iterator():
             last_iter_time = time.time()
-            the_frame = self.camera.get_frame(frame)
-            self.drawer.set_frame(the_frame)
+            frame_number += 1
+            self.num_rejected_points = 0
+            display_needed = self.display_needed_cb is None or \
+                             self.display_needed_cb()
 
             if self.old_gray is None:
+                # The drawing class is about to be reset, so finish rendering
+                # the previous frame first
+                self.display_render(pending_worker)
+                pending_worker = None
+
                 # Take first frame and find corners in it
-                self.old_gray = cv2.cvtColor(the_frame, cv2.COLOR_BGR2GRAY)
+                self.old_gray = self.convert_to_gray( \
+                    self.prepare_frame(the_frame))
                 self.p0 = cv2.goodFeaturesToTrack(self.old_gray, mask = None, \
                                                   **self.feature_params)
 
                 # Reset the state of the optical flow drawing class
+                self.drawer.set_frame(the_frame)
                 self.drawer.reset()
 
                 # Move on to next frame capture
-                filter_update_time = last_iter_time
-                self.scale_filter.reset_filter()
+                old_frame_time = frame_time
+                pool.reset_filters([self.scale_filter, self.zone_filter])
                 continue
 
-            frame_gray = cv2.cvtColor(the_frame, cv2.COLOR_BGR2GRAY)
+            frame_gray = self.convert_to_gray(self.prepare_frame(the_frame))
 
             # Calculate optical flow
             p1, st, _ = cv2.calcOpticalFlowPyrLK(self.old_gray, frame_gray, \
@@ -200,37 +550,75 @@ class ObstacleAvoiderThread(Thread):
                 # We lost all tracking at this point; reinitialize the obstacle
                 # avoider
                 self.old_gray = None
-                self.imgdisp_cb(cv2, the_frame)
+                self.display_render(pending_worker)
+                pending_worker = None
+                if display_needed:
+                    self.frame_info = (frame_number, frame_time)
+                    self.imgdisp_cb(cv2, the_frame)
                 k = cv2.waitKey(30) & 0xff
                 if k == 27: # Was escape pressed?
                     break
                 continue
 
             # Select good points
-            good_new = p1[st == 1]
-            good_old = self.p0[st == 1]
+            good = st.ravel() == 1
+            if self.fb_threshold is not None:
+                good = self.check_forward_backward(frame_gray, p1, good)
+            good_new = p1.reshape(-1, 2)[good]
+            good_old = self.p0.reshape(-1, 2)[good]
+            self.ensure_capacity(len(good_new))
+
+            # Nothing is rendered while nobody is watching. The optical flow
+            # trails are out of date once somebody is watching again, so the
+            # drawing class is reset then. The previous frame was not
+            # rendered in that case, so no rendering is in progress.
+            if display_needed and not rendering:
+                self.drawer.set_frame(the_frame)
+                self.drawer.reset()
+            rendering = display_needed
 
-            # Start worker up
-            worker = FrameWorker(self, frame_gray, last_iter_time, \
-                filter_update_time, good_old, good_new)
-            worker.start()
+            # Hand the frame over to the worker threads, with the feature
+            # points in camera frame coordinates
+            worker = FrameWorker(self, the_frame if rendering else None, \
+                np.shape(the_frame)[:2], \
+                frame_time, old_frame_time, \
+                self.to_frame_coordinates(good_old), \
+                self.to_frame_coordinates(good_new), frame_number)
+            worker.start(pool)
 
             # Once we have results from the TTC computation, use them
             worker.wait_on_ttc_computation()
-            filter_update_time = worker.get_latest_ttc_update_time()
             min_ttc, left_ttc, right_ttc = worker.get_ttc_values()
+            zone_ttcs = worker.get_zone_ttc_values()
+            self.frame_info = (frame_number, frame_time)
             if min_ttc is not None:
                 self.min_ttc_cb(min_ttc)
+                if zone_ttcs is not None and self.zone_ttc_cb is not None:
+                    self.zone_ttc_cb(zone_ttcs)
                 self.balance_strategy_cb(left_ttc, right_ttc)
 
             # Now update the previous frame and previous points
-            if self.old_gray is not None:
-                self.old_gray = frame_gray.copy()
-                self.p0 = good_new.reshape(-1,1,2)
+            self.old_gray = frame_gray
+            self.p0 = good_new.reshape(-1,1,2)
+            old_frame_time = frame_time
+
+            # Make up for lost feature points, either when there are too few
+            # of them or periodically
+            frames_since_replenish += 1
+            if worker.has_lost_tracking() or \
+               (self.replenish_interval > 0 and \
+                frames_since_replenish >= self.replenish_interval):
+                self.replenish_features(frame_gray)
+                frames_since_replenish = 0
+            if len(self.p0) == 0:
+                # We lost all tracking at this point; reinitialize the
+                # obstacle avoider
+                self.old_gray = None
 
-            # Once we have results from the render, use them
-            worker.wait_on_render()
-            self.imgdisp_cb(cv2, cv2.add(the_frame, worker.get_updated_mask()))
+            # Display the previous frame, whose rendering overlapped with the
+            # processing of this frame
+            self.display_render(pending_worker)
+            pending_worker = worker
 
             # Idle for whatever time we have left
             iter_time = time.time()
@@ -241,7 +629,10 @@ class ObstacleAvoiderThread(Thread):
             if k == 27: # Was escape pressed?
                 break
 
+        self.display_render(pending_worker)
+        pool.shutdown()
         cv2.destroyAllWindows()
+        self.grabber.stop()
         self.camera.destroy()
 
 class ObstacleAvoider:
@@ -251,16 +642,124 @@ class ObstacleAvoider:
     is handled by a separate Python thread, which is useful in multi-threaded
     applications.
     """
-    def __init__(self):
+    def __init__(self, max_corners=100, use_process=False, \
+        latest_frame_only=True):
         """
         Constructor for ObstacleAvoider. It initializes a thread class. Its
         constructor sets up the parameters for camera snapshot retrieval as
         well as the parameters for optical flow feature selection and
-        time-to-collision (TTC) calculations.
+        time-to-collision (TTC) calculations. The optional parameter
+        max_corners (with default value 100) is the maximum number of feature
+        points to track, the optional parameter use_process (with default
+        value False) determines whether TTC computations are done in a
+        separate process, which lets them run on another CPU core, and the
+        optional parameter latest_frame_only (with default value True)
+        determines whether stale camera frames are dropped in favor of the
+        most recent one, which keeps the TTC values as fresh as possible.
         """
-        self.thread = ObstacleAvoiderThread()
+        self.thread = ObstacleAvoiderThread(max_corners, use_process, \
+                                            latest_frame_only)
         self.thread.daemon = True
 
+    def set_max_corners(self, max_corners):
+        """
+        Setter for the maximum number of feature points to track. The new
+        value takes effect the next time corners are detected. If the TTC
+        computations are done in a separate process, the value is limited to
+        the maximum number of feature points at the time the obstacle avoider
+        was started.
+        """
+        self.thread.set_max_corners(max_corners)
+
+    def set_decaying_trails(self, decaying):
+        """
+        Setter for whether the optical flow trails are drawn into a single
+        accumulator image that fades out, which uses less memory than the
+        default ring of trail layers. This function must be called before the
+        obstacle avoider is started.
+        """
+        self.thread.set_decaying_trails(decaying)
+
+    def set_replenish_interval(self, replenish_interval):
+        """
+        Setter for the number of frames between attempts to replace lost
+        feature points with new ones. A value of 0 means that new feature
+        points are only looked for when there are too few of them to compute
+        the TTC values.
+        """
+        self.thread.set_replenish_interval(replenish_interval)
+
+    def set_forward_backward_threshold(self, fb_threshold):
+        """
+        Setter for the forward-backward consistency check. Each feature point
+        is tracked back from the new frame to the old one, and it is rejected
+        if it lands more than fb_threshold pixels away from where it started.
+        A value of None turns the check off.
+        """
+        self.thread.set_forward_backward_threshold(fb_threshold)
+
+    def get_num_rejected_points(self):
+        """
+        Returns the number of feature points that the forward-backward
+        consistency check rejected in the most recent frame.
+        """
+        return self.thread.get_num_rejected_points()
+
+    def set_scale_filter(self, scale_filter):
+        """
+        Setter for the filter used for smoother TTC computations, which must
+        be a FilterBank with three inputs (for the whole snapshot, the left
+        half, and the right half). This function must be called before the
+        obstacle avoider is started.
+        """
+        self.thread.set_scale_filter(scale_filter)
+
+    def set_roi(self, roi):
+        """
+        Setter for the region of interest, given as a tuple (x, y, width,
+        height) in pixels of the camera frame. Only this part of each frame
+        is used for feature detection and optical flow, e.g. the lower central
+        band for a floor robot. A value of None means that the entire frame is
+        used. This function must be called before the obstacle avoider is
+        started.
+        """
+        self.thread.set_roi(roi)
+
+    def set_processing_scale(self, processing_scale):
+        """
+        Setter for the factor by which the region of interest is scaled before
+        feature detection and optical flow, e.g. 0.5 to process frames at half
+        the resolution. This function must be called before the obstacle
+        avoider is started. Scales below 1 make the TTC values noisier and
+        biased low (see ObstacleAvoiderThread.set_processing_scale).
+        """
+        self.thread.set_processing_scale(processing_scale)
+
+    def get_frame_info(self):
+        """
+        Returns a pair containing the number and the capture time (in seconds)
+        of the camera snapshot that the callback being called refers to. This
+        allows TTC values to be matched with the image they were computed
+        from, since images are displayed one snapshot later. This function is
+        meant to be called from within the callbacks.
+        """
+        return self.thread.get_frame_info()
+
+    def set_display_needed_cb(self, display_needed_cb):
+        """
+        Setter for the display needed callback, which is called for each
+        camera snapshot to find out whether anybody is watching. If it returns
+        False, the optical flow tracks are not rendered and the image display
+        callback is not called, which saves the work of drawing and encoding
+        images that nobody sees. display_needed_cb takes on the following
+        format:
+
+           display_needed_cb()
+
+        By default, every snapshot is rendered and displayed.
+        """
+        self.thread.set_display_needed_cb(display_needed_cb)
+
     def set_imgdisp_cb(self, imgdisp_cb):
         """
         Setter for the image display callback. imgdisp_cb takes on the
@@ -301,6 +800,32 @@ class ObstacleAvoider:
         """
         self.thread.set_balance_strategy_cb(balance_strategy_cb)
 
+    def set_zone_grid(self, columns, rows=1):
+        """
+        Setter for the grid of zones that each get their own TTC value, where
+        columns is the number of columns of zones, and the optional parameter
+        rows (with default value 1) is the number of rows of zones. The zones
+        cover the region of interest, or the entire frame if there is none. A
+        value of None for columns turns the zones off. This function must be
+        called before the obstacle avoider is started.
+        """
+        self.thread.set_zone_grid(columns, rows)
+
+    def set_zone_ttc_cb(self, zone_ttc_cb):
+        """
+        Setter for the zone TTC callback, which is called when the computation
+        of the minimum TTC value for each zone of a particular camera snapshot
+        has finished. It is called before the balance strategy callback, and
+        only if a zone grid is set. zone_ttc_cb takes on the following format:
+
+           zone_ttc_cb(zone_ttcs)
+
+        where zone_ttcs is a NumPy array with the minimum TTC value of each
+        zone, with one row per row of zones and one column per column of
+        zones.
+        """
+        self.thread.set_zone_ttc_cb(zone_ttc_cb)
+
     def start(self):
         """
         Starts the thread, which takes care of camera snapshot retrieval,
@@ -309,8 +834,10 @@ class ObstacleAvoider:
         snapshot, which is useful for detecting obstacles, as well as for the
         left and right halves of the snapshot, which is useful for deciding
         whether to make a left or right turn. The thread runs until the user
-        decides to terminate it.
+        decides to terminate it. If TTC computations are done in a separate
+        process, that process is started first.
         """
+        self.thread.start_ttc_process()
         self.thread.start()
 
     def join(self):
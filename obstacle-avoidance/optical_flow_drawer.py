@@ -1,6 +1,16 @@
 """
 This module contains functions implementing the drawing of optical flows. The
 trail size for all optical flows is bounded to prevent clutter.
+
+The optical flow vectors of each frame are drawn once into their own layer,
+and the trail is made up of a fixed ring of such layers. Feature points take
+their colors from a small palette, so that all vectors and circles of the same
+color are drawn with a single call to OpenCV.
+
+Alternatively, the trails can be drawn into a single accumulator image that is
+faded in place on every frame, which needs the memory of one frame instead of
+one frame per layer, at the cost of trails that fade out instead of ending
+abruptly.
 """
 
 __author__ = "Ron Wright"
@@ -14,21 +24,47 @@ class OpticalFlowDrawer:
     """
     Class for drawing optical flows.
     """
-    def __init__(self, max_corners, trail_size=15):
+    # Number of fractional bits used for the coordinates of the drawings
+    SHIFT = 4
+
+    def __init__(self, max_corners, trail_size=15, num_colors=16, \
+                 decaying=False):
         """
         Constructor for OpticalFlowDrawer, where max_corners is the maximum
-        number of corners that is used to find corner points, and the optional
+        number of corners that is used to find corner points, the optional
         parameter trail_size (with default value 15) is the maximum trail size
-        (in frames) for any given optical flow.
+        (in frames) for any given optical flow, the optional parameter
+        num_colors (with default value 16) is the number of colors in the
+        palette that the feature points take their colors from, and the
+        optional parameter decaying (with default value False) determines
+        whether the trails are drawn into a single accumulator image that
+        fades out over trail_size frames.
         """
         self.frame = None
 
         self.restore_init_state()
-        self.masks = None
+        self.layers = None
+        self.composite = None
         self.trail_size = trail_size
+        self.set_decaying(decaying)
 
         # Create some random colors
-        self.color = np.random.randint(0, 255, (max_corners, 3))
+        num_colors = max(1, min(num_colors, max_corners))
+        self.color = [tuple(color) for color in \
+                      np.random.randint(0, 255, (num_colors, 3)).tolist()]
+
+    def set_decaying(self, decaying):
+        """
+        Setter for whether the trails are drawn into a single accumulator
+        image that fades out over the trail size, instead of a ring of layers.
+        The new value takes effect the next time the state is reset.
+        """
+        self.decaying = decaying
+        self.layers = None
+
+        # The accumulator is faded so that a fully saturated trail falls below
+        # one intensity level after trail_size frames
+        self.decay = (1.0 / 256) ** (1.0 / self.trail_size)
 
     def set_frame(self, frame):
         """
@@ -39,48 +75,68 @@ class OpticalFlowDrawer:
     def restore_init_state(self):
         """
         Helper function for the constructor and the reset function that resets
-        the mask index and count variables. This function should not be used
+        the layer index and count variables. This function should not be used
         directly outside this class.
         """
-        self.curr_mask_index = 0
-        self.mask_count = 0
+        self.curr_layer_index = 0
+        self.layer_count = 0
 
     def reset(self):
         """
         Resets the entire state of the optical flow drawing class.
         """
-        # Create mask images for drawing purposes
+        # Create layer images for drawing purposes
         self.restore_init_state()
-        self.masks = [np.zeros_like(self.frame) \
-                      for _ in range(self.trail_size)]
+        if self.layers is None or \
+           np.shape(self.layers[0]) != np.shape(self.frame):
+            num_layers = 1 if self.decaying else self.trail_size
+            self.layers = [np.zeros_like(self.frame) \
+                           for _ in range(num_layers)]
+            self.composite = None if self.decaying \
+                             else np.zeros_like(self.frame)
+        else:
+            for layer in self.layers:
+                layer.fill(0)
 
-    def draw_line(self, index, a, b, c, d):
+    def to_fixed_point(self, features):
         """
-        Helper function for draw_tracks that draws a line in the current mask
-        as well as the previous masks. This function should not be used
+        Helper function that converts the coordinates of features into the
+        fixed-point format used for drawing. This function should not be used
         directly outside this class.
         """
-        for mask_index in range(min(self.mask_count + 1, self.trail_size)):
-            cv2.line(self.masks[mask_index], (a,b),(c,d), \
-                     self.color[index].tolist(), 2, lineType=cv2.CV_AA)
+        return np.round(np.reshape(features, (-1, 2)) * \
+                        (1 << OpticalFlowDrawer.SHIFT)).astype(np.int32)
 
     def get_current_mask(self):
         """
-        Returns the currently active mask.
+        Returns the mask containing the optical flow trails, which is made up
+        of all layers in the trail.
         """
-        return self.masks[self.curr_mask_index]
+        if self.decaying:
+            return self.layers[0]
+
+        np.copyto(self.composite, self.layers[0])
+        for layer in self.layers[1:self.layer_count + 1]:
+            cv2.max(self.composite, layer, dst=self.composite)
+        return self.composite
 
     def update_frame_state(self):
         """
-        Updates the frame state for the next iteration. Once we have all masks
-        filled out, the current mask is cleared out to facilitate the drawing
-        of finite-length optical flow trails.
-        """
-        if self.mask_count >= self.trail_size:
-            self.masks[self.curr_mask_index] = np.zeros_like(self.frame)
-            self.curr_mask_index = (self.curr_mask_index + 1) % self.mask_count
-        else:
-            self.mask_count += 1
+        Updates the frame state for the next iteration. Once all layers are
+        filled out, the oldest layer is cleared out and reused for the next
+        frame to facilitate the drawing of finite-length optical flow trails.
+        With decaying trails, the accumulator is faded out instead. The
+        negative offset makes sure that faint trails reach zero instead of
+        being held at the lowest intensity level by rounding.
+        """
+        if self.decaying:
+            cv2.addWeighted(self.layers[0], self.decay, self.layers[0], 0, \
+                            -0.5, dst=self.layers[0])
+            return
+
+        self.curr_layer_index = (self.curr_layer_index + 1) % self.trail_size
+        self.layers[self.curr_layer_index].fill(0)
+        self.layer_count = min(self.layer_count + 1, self.trail_size - 1)
 
     def draw_tracks(self, old_features, new_features):
         """
@@ -89,10 +145,24 @@ class OpticalFlowDrawer:
         set of old good features, and new_features is the set of new good
         features.
         """
-        for i,(new, old) in enumerate(zip(new_features, old_features)):
-            # draw the optical flow vector
-            a,b = new.ravel()
-            c,d = old.ravel()
+        new_points = self.to_fixed_point(new_features)
+        segments = np.stack((new_points, self.to_fixed_point(old_features)), \
+                            axis=1)
+        dots = np.stack((new_points, new_points), axis=1)
+        layer = self.layers[self.curr_layer_index]
+        num_colors = len(self.color)
+        for color_index, color in enumerate(self.color):
+            # The feature points of the same color are drawn together
+            color_segments = segments[color_index::num_colors]
+            if len(color_segments) == 0:
+                break
+            color_dots = dots[color_index::num_colors]
+
+            # draw the optical flow vectors
+            cv2.polylines(layer, list(color_segments), False, color, 2, \
+                          lineType=cv2.CV_AA, shift=OpticalFlowDrawer.SHIFT)
 
-            self.draw_line(i, a, b, c, d)
-            cv2.circle(self.frame, (a,b),5,self.color[i].tolist(),-1)
+            # draw the feature points as dots, which are lines of zero length
+            # whose round caps make up filled circles of radius 5
+            cv2.polylines(self.frame, list(color_dots), False, color, 10, \
+                          shift=OpticalFlowDrawer.SHIFT)
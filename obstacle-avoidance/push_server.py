@@ -1,6 +1,33 @@
 """
 This module implements a server that sends messages to connected clients in
-real time.
+real time. Each message is encoded once, with a 4-byte length prefix, when it
+is pushed, and the same encoded message is sent to every client.
+
+All clients are served by a single thread, which waits for new connections,
+new messages and sockets ready for writing with select. Messages are written
+without blocking, so a slow client never holds up the others. Each client has
+its own bounded queue of messages waiting to be sent:
+
+1. With a queue size of 1, only the most recent message is kept, which suits
+   frames.
+2. With a larger queue size, messages are delivered in order, and the oldest
+   message is dropped when the queue is full, which suits TTC values.
+
+A client that lags too far behind can be disconnected. The number of messages
+delivered to and dropped for each client are counted.
+
+Messages can be tagged with a record type (a number from 0 to 7), which allows
+different kinds of messages to share one connection. A client chooses the
+record types it wants by sending a byte in which bit i selects record type i;
+the most recent byte applies. A client that does not send such a byte gets
+the default record types of the server, which are all record types unless
+chosen otherwise. The server can give new clients a grace period in which to
+choose: until the byte arrives or the grace period is over, messages with a
+record type are held back for the client, and then only those it wants are
+queued. Clients can thus tell messages apart by the record types they chose,
+without having to guess what was sent before their choice took effect.
+Messages of a record type can also be pushed as latest-only, in which case
+they replace any message of the same record type still waiting to be sent.
 """
 
 __author__ = "Ron Wright"
@@ -8,77 +35,425 @@ __copyright__ = "Copyright 2015 Ronald Joseph Wright"
 __maintainer__ = "Ron Wright"
 
 import socket, socket_util
-from threading import Condition
+from collections import deque
+from threading import Lock
 import threading
+import select
+import errno
+import time
+import os
+
+class ClientSession:
+    """
+    Class holding the state of the connection to a single client.
+    """
+    def __init__(self, conn, addr, queue_size, max_lag, subscriptions=None, \
+                 subscription_deadline=None):
+        """
+        Constructor for ClientSession, where conn is the non-blocking socket
+        connected to the client, addr is the address of the client,
+        queue_size is the maximum number of messages waiting to be sent,
+        max_lag is the number of messages that can be dropped in a row before
+        the client is considered to be lagging (or None if clients are never
+        considered to be lagging), and the optional parameter subscriptions
+        (with default value None) is the bit mask of record types that the
+        client wants (or None for all record types) unless it chooses its own.
+        If the optional parameter subscription_deadline (with default value
+        None) is given, messages with a record type are held back until the
+        client chooses the record types it wants or until that time (as
+        given by time.time) has passed.
+        """
+        self.conn = conn
+        self.addr = addr
+        self.subscriptions = subscriptions
+        self.subscription_deadline = subscription_deadline
+        self.held = deque()
+        self.queue = deque()
+        self.queue_size = queue_size
+        self.max_lag = max_lag
+
+        # Encoded message being sent, and the number of bytes sent so far
+        self.payload = None
+        self.offset = 0
+
+        # Statistics
+        self.num_delivered = 0
+        self.num_dropped = 0
+        self.lag = 0
+
+    def fileno(self):
+        """
+        Returns the file descriptor of the socket, which allows the session
+        to be passed to select directly.
+        """
+        return self.conn.fileno()
+
+    def is_sending(self):
+        """
+        Returns whether part of a message is yet to be sent.
+        """
+        return self.payload is not None
+
+    def is_lagging(self):
+        """
+        Returns whether too many messages were dropped in a row.
+        """
+        return self.max_lag is not None and self.lag > self.max_lag
+
+    def wants(self, record_type):
+        """
+        Returns whether the client wants messages of record type record_type.
+        Messages without a record type (None) are always wanted, and so are
+        all messages while the client has yet to choose the record types it
+        wants.
+        """
+        return record_type is None or self.subscriptions is None or \
+               self.subscription_deadline is not None or \
+               (self.subscriptions >> record_type) & 1 == 1
+
+    def set_subscriptions(self, data):
+        """
+        Sets the record types that the client wants from the data data sent
+        by the client, of which only the last byte counts. Any messages held
+        back until then are queued if the client wants them.
+        """
+        self.subscriptions = bytearray(data)[-1]
+        self.release_held_messages()
+
+    def check_subscription_deadline(self, now):
+        """
+        Queues any messages held back for the client if the client has not
+        chosen the record types it wants by the time now, in which case it
+        gets the default record types.
+        """
+        if self.subscription_deadline is not None and \
+           now >= self.subscription_deadline:
+            self.release_held_messages()
+
+    def release_held_messages(self):
+        """
+        Helper function that stops holding back messages and queues those
+        that the client wants. This function should not be used directly
+        outside this class.
+        """
+        self.subscription_deadline = None
+        held = self.held
+        self.held = deque()
+        for payload, record_type, latest_only in held:
+            self.enqueue(payload, record_type, latest_only)
+
+    def hold(self, payload, record_type, latest_only):
+        """
+        Helper function that holds back the encoded message payload of record
+        type record_type until the client has chosen the record types it
+        wants. At most queue_size messages are held, as in the queue, but
+        messages dropped here are not counted since the client may not want
+        them. This function should not be used directly outside this class.
+        """
+        if latest_only:
+            self.held = deque([entry for entry in self.held \
+                               if entry[1] != record_type])
+        if len(self.held) >= self.queue_size:
+            self.held.popleft()
+        self.held.append((payload, record_type, latest_only))
+
+    def enqueue(self, payload, record_type=None, latest_only=False):
+        """
+        Queues the encoded message payload of record type record_type (or
+        None) to be sent, unless the client does not want it. If latest_only
+        is True, any waiting messages of the same record type are dropped.
+        The oldest waiting message is dropped if the queue is full. Messages
+        with a record type are held back instead while the client has yet to
+        choose the record types it wants.
+        """
+        if record_type is not None and self.subscription_deadline is not None:
+            self.hold(payload, record_type, latest_only)
+            return
+        if not self.wants(record_type):
+            return
+        if latest_only:
+            kept = [entry for entry in self.queue if entry[0] != record_type]
+            num_replaced = len(self.queue) - len(kept)
+            if num_replaced > 0:
+                self.queue = deque(kept)
+                self.num_dropped += num_replaced
+                self.lag += num_replaced
+        if len(self.queue) >= self.queue_size:
+            self.queue.popleft()
+            self.num_dropped += 1
+            self.lag += 1
+        self.queue.append((record_type, payload))
+        if self.payload is None:
+            self.next_payload()
+
+    def next_payload(self):
+        """
+        Helper function that starts sending the next waiting message, if any.
+        This function should not be used directly outside this class.
+        """
+        self.payload = self.queue.popleft()[1] if self.queue else None
+        self.offset = 0
+
+    def send_pending(self):
+        """
+        Sends as much of the waiting messages as the socket accepts without
+        blocking. socket.error is raised if the connection fails.
+        """
+        while self.payload is not None:
+            try:
+                self.offset += self.conn.send( \
+                    memoryview(self.payload)[self.offset:])
+            except socket.error as e:
+                if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    raise
+                return
+            if self.offset < len(self.payload):
+                return
+            self.num_delivered += 1
+            self.lag = 0
+            self.next_payload()
+
+    def get_stats(self):
+        """
+        Returns a dictionary with the address of the client and the number of
+        messages delivered to and dropped for the client.
+        """
+        return {'address': self.addr, 'delivered': self.num_delivered, \
+                'dropped': self.num_dropped}
 
 class PushServer(object):
     """
     Class for sending messages to clients in real time
     """
-    def __init__(self, port, backlog=5, use_json=False):
+    def __init__(self, port, backlog=5, use_json=False, queue_size=1, \
+                 max_lag=None, default_subscriptions=None, \
+                 subscription_grace_period=None):
         """
         Constructor for PushServer, where port is the port number to use for
         the push server, and the optional parameter backlog (with default
         value 5) is the maximum number of incoming client connections that can
-        wait between successive accept calls.
+        wait between successive accept calls. If the optional parameter
+        use_json (with default value False) is True, messages are encoded into
+        JSON format; otherwise, they are sent as raw bytes. The optional
+        parameter queue_size (with default value 1) is the maximum number of
+        messages waiting to be sent to each client, where a value of 1 means
+        that only the most recent message is sent, and the optional parameter
+        max_lag (with default value None) is the number of messages that can
+        be dropped in a row for a client before it is disconnected (or None
+        if clients are never disconnected for lagging). The optional parameter
+        default_subscriptions (with default value None) is the bit mask of
+        record types sent to clients that have not chosen any (or None for
+        all record types), and the optional parameter
+        subscription_grace_period (with default value None) is the time (in
+        seconds) that new clients have to choose the record types they want
+        before messages with a record type are sent to them (or None if such
+        messages are sent right away).
         """
         if use_json:
-            self.send_func = socket_util.send_msg_as_json
+            self.pack_func = socket_util.pack_json_msg
         else:
-            self.send_func = socket_util.send_msg_as_base64
+            self.pack_func = socket_util.pack_msg
 
         self.s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.s.bind(('', port))
         self.s.listen(backlog)
+        self.s.setblocking(0)
+        self.queue_size = queue_size
+        self.max_lag = max_lag
+        self.default_subscriptions = default_subscriptions
+        self.subscription_grace_period = subscription_grace_period
         self.message_to_push = None
-        self.seq_number = 0
-        self.cv = Condition()
+        self.new_messages = []
+        self.sessions = []
+        self.lock = Lock()
+
+        # Pipe for waking up the server thread when a message is pushed
+        self.wakeup_read_fd, self.wakeup_write_fd = os.pipe()
+        self.wakeup_pending = False
 
-    def push_message(self, message):
+    def has_clients(self, record_type=None):
         """
-        Sets the message to be sent to connected clients.
+        Returns whether any clients are connected. If the optional parameter
+        record_type (with default value None) is given, only clients that want
+        messages of that record type count.
         """
-        self.cv.acquire()
-        self.message_to_push = message
-        self.seq_number += 1
-        self.cv.notifyAll()
-        self.cv.release()
+        for session in list(self.sessions):
+            if session.wants(record_type):
+                return True
+        return False
 
-    def handle_request(self, conn, addr):
+    def get_dropped_count(self, record_type=None):
         """
-        Client session function that sends messages to the client in real time.
-        This function should not be used directly outside this class.
+        Returns the total number of messages dropped for the connected
+        clients. If the optional parameter record_type (with default value
+        None) is given, only clients that want messages of that record type
+        count.
+        """
+        return sum([session.num_dropped for session in list(self.sessions) \
+                    if session.wants(record_type)])
+
+    def get_client_stats(self):
+        """
+        Returns a list with a dictionary for each connected client, containing
+        the address of the client and the number of messages delivered to and
+        dropped for the client.
+        """
+        return [session.get_stats() for session in list(self.sessions)]
+
+    def push_message(self, message, record_type=None, latest_only=False):
+        """
+        Sets the message to be sent to connected clients. The message is
+        encoded here, once for all clients. If the optional parameter
+        record_type (with default value None) is given, the message is only
+        sent to clients that want messages of that record type, and if the
+        optional parameter latest_only (with default value False) is True,
+        the message replaces any message of the same record type that is
+        still waiting to be sent.
+        """
+        packed_message = self.pack_func(message)
+        self.lock.acquire()
+        self.new_messages.append((packed_message, record_type, latest_only))
+        wakeup_needed = not self.wakeup_pending
+        self.wakeup_pending = True
+        self.lock.release()
+        if wakeup_needed:
+            os.write(self.wakeup_write_fd, b'\0')
+
+    def accept_connections(self):
+        """
+        Helper function that accepts all waiting client connections. This
+        function should not be used directly outside this class.
         """
-        conn_closed = False
-        old_seq_number = 0
-        while not conn_closed:
-            self.cv.acquire()
-            while old_seq_number == self.seq_number:
-                self.cv.wait()
-            message_to_push = self.message_to_push
-            old_seq_number = self.seq_number
-            self.cv.release()
+        while True:
             try:
-                self.send_func(conn, message_to_push)
-            except socket.error:
-                conn_closed = True
+                conn, addr = self.s.accept()
+            except socket.error as e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                raise
+            conn.setblocking(0)
+            subscription_deadline = None
+            if self.subscription_grace_period is not None:
+                subscription_deadline = \
+                    time.time() + self.subscription_grace_period
+            session = ClientSession(conn, addr, self.queue_size, \
+                                    self.max_lag, self.default_subscriptions, \
+                                    subscription_deadline)
+            if self.message_to_push is not None:
+                session.enqueue(*self.message_to_push)
+            self.sessions.append(session)
+
+    def close_session(self, session):
+        """
+        Helper function that closes the connection to a client and forgets
+        about it. This function should not be used directly outside this
+        class.
+        """
+        self.sessions.remove(session)
+        try:
+            session.conn.close()
+        except socket.error:
+            pass
+
+    def check_session(self, session):
+        """
+        Helper function for a client socket that is ready for reading, either
+        because the connection was closed or because the client chose the
+        record types it wants. This function should not be used directly
+        outside this class.
+        """
+        try:
+            data = session.conn.recv(4096)
+        except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            data = None
+        if not data:
+            self.close_session(session)
+        else:
+            session.set_subscriptions(data)
+
+    def send_to_session(self, session):
+        """
+        Helper function that sends data to a client socket that is ready for
+        writing. This function should not be used directly outside this
+        class.
+        """
+        try:
+            session.send_pending()
+        except socket.error:
+            self.close_session(session)
+
+    def distribute_messages(self):
+        """
+        Helper function that queues the messages pushed since the last call
+        for every client, and disconnects clients that lag too far behind.
+        This function should not be used directly outside this class.
+        """
+        self.lock.acquire()
+        new_messages = self.new_messages
+        self.new_messages = []
+        self.lock.release()
+        for payload, record_type, latest_only in new_messages:
+            # Only the latest untyped message is sent to new clients
+            if record_type is None:
+                self.message_to_push = (payload, record_type, latest_only)
+            for session in self.sessions:
+                session.enqueue(payload, record_type, latest_only)
+        now = time.time()
+        for session in list(self.sessions):
+            session.check_subscription_deadline(now)
+            if session.is_lagging():
+                self.close_session(session)
 
-    def continuously_check_for_new_connections(self):
+    def get_select_timeout(self):
         """
-        Service function for accepting incoming client connections. A session
-        thread is allocated for each connection. This function should not be
-        used directly outside this class.
+        Helper function that returns how long (in seconds) the server thread
+        can wait for sockets before a client runs out of time to choose the
+        record types it wants, or None if no client is choosing. This
+        function should not be used directly outside this class.
+        """
+        deadlines = [session.subscription_deadline \
+                     for session in self.sessions \
+                     if session.subscription_deadline is not None]
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - time.time())
+
+    def serve_clients(self):
+        """
+        Service function that accepts incoming client connections and sends
+        messages to all clients. This function should not be used directly
+        outside this class.
         """
         while True:
-            conn, addr = self.s.accept()
-            t = threading.Thread(target=self.handle_request, args=(conn, addr))
-            t.daemon = True
-            t.start()
+            readers = [self.s, self.wakeup_read_fd] + self.sessions
+            writers = [session for session in self.sessions \
+                       if session.is_sending()]
+            readable, writable, _ = select.select(readers, writers, [], \
+                                                  self.get_select_timeout())
+
+            if self.wakeup_read_fd in readable:
+                self.lock.acquire()
+                os.read(self.wakeup_read_fd, 4096)
+                self.wakeup_pending = False
+                self.lock.release()
+            if self.s in readable:
+                self.accept_connections()
+            for session in readable:
+                if isinstance(session, ClientSession) and \
+                   session in self.sessions:
+                    self.check_session(session)
+            for session in writable:
+                if session in self.sessions:
+                    self.send_to_session(session)
+
+            self.distribute_messages()
 
     def run_daemon_thread(self):
         """
         Starts the push server thread.
         """
-        t = threading.Thread(target=self.continuously_check_for_new_connections)
+        t = threading.Thread(target=self.serve_clients)
         t.daemon = True
         t.start()
@@ -1,84 +1,67 @@
 import sys
 import socket
-from frame_client import FrameClient
-from ttc_client import TTCClient
-import threading
-import time
+from telemetry_client import TelemetryClient
+import telemetry
 import cv2
 
-def check_returned_value(value):
-    return float('inf') if value == 'Infinity' else value
+def print_ttc_values(frame_number, ttc_values, zone_ttcs, num_lines):
+    sys.stdout.write("\033[A\033[K" * num_lines)
+    lines = ["Frame %d"%(frame_number)]
+    if ttc_values is not None:
+        lines.append("Min TTC: %g"%(ttc_values[0]))
+        lines.append("Left TTC: %g, Right TTC: %g"%(ttc_values[1], \
+                                                    ttc_values[2]))
+    if zone_ttcs is not None:
+        lines.append("Zone TTC: %s"%(" | ".join([" ".join(["%g"%(ttc) \
+            for ttc in row]) for row in zone_ttcs])))
+    print("\n".join(lines))
+    sys.stdout.flush()
+    return len(lines)
 
-def frame_loop(host):
-    global frame_cli
-    frame_cli = FrameClient(host)
-    while True:
-        try:
-            img = frame_cli.get_frame()
-        except socket.error:
-            break
-        if img is not None:
-            cv2.imshow('Remote Image Viewer', img)
-        # We MUST call waitKey() for an image window to appear
-        k = cv2.waitKey(1) & 0xff
-        if k == 27: # Was escape pressed?
-            break
-
-    try:
-        frame_cli.shutdown()
-    except socket.error:
-        pass
-
-    try:
-        ttc_cli.shutdown()
-    except socket.error:
-        pass
+def main(argv):
+    if len(argv) <= 1:
+        return 1
 
-    sys.exit(0)
+    cli = TelemetryClient(argv[1])
 
-def ttc_loop(host):
-    global ttc_cli
-    ttc_cli = TTCClient(host)
+    # TTC values are sent before the frame they were computed from, so they
+    # are kept until their frame arrives
+    ttc_values = {}
+    zone_ttcs = {}
+    num_lines = 0
     while True:
         try:
-            ttc_dict = ttc_cli.get_ttc_values()
-        except (socket.error, TypeError):
+            record = cli.get_record()
+        except socket.error:
+            break
+        if record is None:
             break
-        if ttc_dict is not None:
-            print("\033[A\033[K\033[A\033[KMin TTC: %g"%( \
-                check_returned_value(ttc_dict['min-ttc'])))
-            print("Left TTC: %g, Right TTC: %g"%( \
-                check_returned_value(ttc_dict['left-ttc']), \
-                check_returned_value(ttc_dict['right-ttc'])))
 
-    try:
-        frame_cli.shutdown()
-    except socket.error:
-        pass
+        record_type, frame_number, frame_time, value = record
+        if record_type == telemetry.RECORD_TTC:
+            ttc_values[frame_number] = value
+        elif record_type == telemetry.RECORD_ZONE_TTC:
+            zone_ttcs[frame_number] = value
+        elif record_type == telemetry.RECORD_FRAME and value is not None:
+            num_lines = print_ttc_values(frame_number, \
+                ttc_values.get(frame_number), zone_ttcs.get(frame_number), \
+                num_lines)
+            for values in (ttc_values, zone_ttcs):
+                for old_frame_number in list(values.keys()):
+                    if old_frame_number <= frame_number:
+                        del values[old_frame_number]
+
+            cv2.imshow('Remote Image Viewer', value)
+            # We MUST call waitKey() for an image window to appear
+            k = cv2.waitKey(1) & 0xff
+            if k == 27: # Was escape pressed?
+                break
 
     try:
-        ttc_cli.shutdown()
+        cli.shutdown()
     except socket.error:
         pass
 
-    sys.exit(0)
-
-def main(argv):
-    if len(argv) <= 1:
-        return 1
-
-    print("\n")
-
-    t1 = threading.Thread(target=frame_loop, args=(argv[1],))
-    t2 = threading.Thread(target=ttc_loop, args=(argv[1],))
-
-    t1.daemon = t2.daemon = True
-    t1.start()
-    t2.start()
-
-    while threading.active_count() > 1:
-        time.sleep(0.1)
-
     return 0
 
 if __name__ == '__main__':
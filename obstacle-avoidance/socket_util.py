@@ -2,6 +2,11 @@
 This module contains functions that make sending large amounts of data over a
 socket connection easier. The code was taken from
 http://stackoverflow.com/questions/17667903.
+
+Clients that receive a stream of messages should use SocketReader, which reads
+the socket in large chunks through a buffer instead of one byte or one message
+part at a time. Newline-terminated messages (in base-64 or JSON) can only be
+received through SocketReader.
 """
 
 __author__ = "Ron Wright"
@@ -10,91 +15,236 @@ __maintainer__ = "Ron Wright"
 
 import struct
 from math import isinf
-from base64 import b64encode, b64decode
+from base64 import b64decode
 from json import dumps, loads
 
-def send_msg_as_base64(sock, msg):
+def pack_msg(msg):
     """
-    Encodes the message into base-64 and sends the encoded message using the
-    socket sock.
+    Prefixes the message msg with a 4-byte length (in network byte order) and
+    returns the result, which can be sent as is to any number of sockets.
     """
-    sock.sendall(b64encode(msg) + '\n')
+    return struct.pack('>I', len(msg)) + msg
 
-def send_msg_as_json(sock, msg):
+def pack_json_msg(msg):
     """
-    Encodes the message into JSON format and sends the encoded message using
-    the socket sock.
+    Encodes the message msg into JSON format (as UTF-8 bytes) and prefixes it
+    with a 4-byte length (in network byte order).
     """
-    sock.sendall(dumps(msg) + '\n')
+    return pack_msg(dumps(msg).encode('utf-8'))
 
 def send_msg(sock, msg):
     """
     Prefixes the message msg with a 4-byte length (in network byte order) and
     sends it using the socket sock.
     """
-    msg = struct.pack('>I', len(msg)) + msg
-    sock.sendall(msg)
+    sock.sendall(pack_msg(msg))
 
-def recv_newline_terminated_msg(sock):
-    """
-    Receives a message terminated by a newline and returns the result (without
-    the newline included).
-    """
-    data = ''
-    while True:
-        byte = sock.recv(1)
-        if not byte:
-            break
-        if byte == '\n':
-            return data
-        data += byte
-    return None
-
-def recv_msg_as_base64(sock):
+def recv_msg(sock):
     """
-    Receives a message encoded in base-64, decodes it, and returns the result.
+    Reads the data from the socket sock. First, it reads the 4-byte message
+    length, and then it reads the message data accordingly. This function
+    returns the received bytes (without the 4-byte header), or None if EOF is
+    hit.
     """
-    try:
-        return b64decode(recv_newline_terminated_msg(sock))
-    except TypeError:
+    # Read message length and unpack it into an integer
+    raw_msglen = recvall(sock, 4)
+    if not raw_msglen:
         return None
+    msglen = struct.unpack('>I', raw_msglen)[0]
+    # Read the message data
+    return recvall(sock, msglen)
 
-def recv_msg_as_json(sock):
+def recv_json_msg(sock):
     """
-    Receives a message encoded in JSON, decodes it, and returns the result.
+    Receives a message encoded in JSON with a 4-byte length prefix, decodes
+    it, and returns the result. None is returned if EOF is hit or if the
+    message cannot be decoded.
     """
     try:
-        return loads(recv_newline_terminated_msg(sock))
+        return loads(recv_msg(sock))
     except (TypeError, ValueError):
         return None
 
-def recv_msg(sock):
+def recv_msg_into(sock, buf):
     """
-    Reads the data from the socket sock. First, it reads the 4-byte message
-    length, and then it reads the message data accordingly. This function
-    returns the received bytes (without the 4-byte header), or None if EOF is
-    hit.
+    Reads a message with a 4-byte length prefix (in network byte order) from
+    the socket sock directly into the bytearray buf, which is grown if it is
+    too small and can be reused for the next message. This function returns
+    the length of the message, which starts at the beginning of buf, or None
+    if EOF is hit. The message can be handed to NumPy without any copies,
+    using np.frombuffer(buf, dtype=np.uint8, count=length).
     """
-    # Read message length and unpack it into an integer
     raw_msglen = recvall(sock, 4)
     if not raw_msglen:
         return None
     msglen = struct.unpack('>I', raw_msglen)[0]
-    # Read the message data
-    return recvall(sock, msglen)
+    if len(buf) < msglen:
+        buf.extend(bytearray(msglen - len(buf)))
+    if not recvall_into(sock, memoryview(buf)[:msglen]):
+        return None
+    return msglen
 
 def recvall(sock, n):
     """
     Helper function to recv n bytes, or return None if EOF is HIT. This
     function should not be used directly outside this module.
     """
-    data = ''
-    while len(data) < n:
-        packet = sock.recv(n - len(data))
-        if not packet:
+    data = bytearray(n)
+    if not recvall_into(sock, memoryview(data)):
+        return None
+    return bytes(data)
+
+def recvall_into(sock, view):
+    """
+    Helper function that fills the memoryview view with data received from
+    the socket sock. False is returned if EOF is hit. This function should not
+    be used directly outside this module.
+    """
+    while len(view) > 0:
+        num_bytes = sock.recv_into(view)
+        if num_bytes == 0:
+            return False
+        view = view[num_bytes:]
+    return True
+
+class SocketReader:
+    """
+    Class for receiving messages from a socket through a buffer. Data are
+    read with as few system calls as possible, and both newline-terminated and
+    length-prefixed messages are supported. Only one reader should be used
+    for a socket, since any data after the current message are kept in the
+    buffer.
+    """
+    def __init__(self, sock, buffer_size=65536):
+        """
+        Constructor for SocketReader, where sock is the socket to read from,
+        and the optional parameter buffer_size (with default value 65536) is
+        the initial size of the buffer in bytes. The buffer grows as needed
+        to hold the largest message.
+        """
+        self.sock = sock
+        self.buffer = bytearray(buffer_size)
+        self.start = 0
+        self.end = 0
+
+    def fill(self):
+        """
+        Helper function that reads as much data as fits into the buffer,
+        making room first if needed. False is returned if EOF is hit. This
+        function should not be used directly outside this class.
+        """
+        if self.start == self.end:
+            self.start = self.end = 0
+        elif self.end == len(self.buffer):
+            size = self.end - self.start
+            if self.start > 0:
+                # Move the unread data to the front of the buffer
+                self.buffer[:size] = self.buffer[self.start:self.end]
+            else:
+                self.buffer.extend(bytearray(len(self.buffer)))
+            self.start, self.end = 0, size
+
+        num_bytes = self.sock.recv_into(memoryview(self.buffer)[self.end:])
+        if num_bytes == 0:
+            return False
+        self.end += num_bytes
+        return True
+
+    def recv_newline_terminated_msg(self):
+        """
+        Receives a message terminated by a newline and returns the result
+        (without the newline included), or None if EOF is hit.
+        """
+        num_searched = 0
+        while True:
+            index = self.buffer.find(b'\n', self.start + num_searched, \
+                                     self.end)
+            if index >= 0:
+                data = bytes(self.buffer[self.start:index])
+                self.start = index + 1
+                return data
+            num_searched = self.end - self.start
+            if not self.fill():
+                return None
+
+    def recv_msg_as_base64(self):
+        """
+        Receives a message encoded in base-64, decodes it, and returns the
+        result.
+        """
+        try:
+            return b64decode(self.recv_newline_terminated_msg())
+        except (TypeError, ValueError):
+            return None
+
+    def recv_msg_as_json(self):
+        """
+        Receives a message encoded in JSON, decodes it, and returns the
+        result.
+        """
+        try:
+            return loads(self.recv_newline_terminated_msg())
+        except (TypeError, ValueError):
+            return None
+
+    def recvall(self, n):
+        """
+        Receives exactly n bytes and returns them, or None if EOF is hit.
+        """
+        while self.end - self.start < n:
+            if not self.fill():
+                return None
+        data = bytes(self.buffer[self.start:self.start + n])
+        self.start += n
+        return data
+
+    def recv_msg(self):
+        """
+        Receives a message with a 4-byte length prefix (in network byte order)
+        and returns the message data (without the prefix), or None if EOF is
+        hit.
+        """
+        raw_msglen = self.recvall(4)
+        if not raw_msglen:
+            return None
+        msglen = struct.unpack('>I', raw_msglen)[0]
+        return self.recvall(msglen)
+
+    def recv_msg_into(self, buf):
+        """
+        Receives a message with a 4-byte length prefix (in network byte order)
+        into the bytearray buf, which is grown if it is too small and can be
+        reused for the next message. Any part of the message that is not
+        buffered yet is received directly into buf. The length of the
+        message, which starts at the beginning of buf, is returned, or None if
+        EOF is hit.
+        """
+        raw_msglen = self.recvall(4)
+        if not raw_msglen:
+            return None
+        msglen = struct.unpack('>I', raw_msglen)[0]
+        if len(buf) < msglen:
+            buf.extend(bytearray(msglen - len(buf)))
+
+        view = memoryview(buf)
+        num_buffered = min(msglen, self.end - self.start)
+        view[:num_buffered] = \
+            memoryview(self.buffer)[self.start:self.start + num_buffered]
+        self.start += num_buffered
+        if not recvall_into(self.sock, view[num_buffered:msglen]):
+            return None
+        return msglen
+
+    def recv_json_msg(self):
+        """
+        Receives a message encoded in JSON with a 4-byte length prefix,
+        decodes it, and returns the result. None is returned if EOF is hit or
+        if the message cannot be decoded.
+        """
+        try:
+            return loads(self.recv_msg())
+        except (TypeError, ValueError):
             return None
-        data += packet
-    return data
 
 def float_to_bytes(value):
     """
@@ -0,0 +1,100 @@
+"""
+This module defines the records that are sent over the telemetry channel,
+which carries image frames and TTC values over a single connection. Each
+record is sent as a message with a 4-byte length prefix (see socket_util),
+and starts with the following header (in network byte order):
+
+    +-------------+-----------------+---------------------------+
+    | record type | frame number    | capture time (in seconds) |
+    | (1 byte)    | (4-byte uint)   | (8-byte IEEE double)      |
+    +-------------+-----------------+---------------------------+
+
+The frame number and capture time identify the camera snapshot that the
+record belongs to, so TTC values can be matched with their frame. The header
+is followed by the data of the record:
+
+1. RECORD_FRAME, the image frame encoded as JPEG
+2. RECORD_TTC, the minimum, left and right TTC values as 8-byte IEEE doubles,
+   where infinite TTC values are sent as IEEE infinity
+3. RECORD_ZONE_TTC, the number of rows and columns of zones as 2-byte
+   unsigned integers, followed by the TTC value of each zone as an 8-byte
+   IEEE double, row by row
+"""
+
+__author__ = "Ron Wright"
+__copyright__ = "Copyright 2015 Ronald Joseph Wright"
+__maintainer__ = "Ron Wright"
+
+import struct
+
+# Record types
+RECORD_FRAME = 0
+RECORD_TTC = 1
+RECORD_ZONE_TTC = 2
+
+HEADER = struct.Struct('>BId')
+TTC_VALUES = struct.Struct('>3d')
+ZONE_GRID = struct.Struct('>HH')
+
+def subscription_mask(record_types):
+    """
+    Returns the byte that a client sends to choose the record types it wants,
+    where record_types is the list of record types.
+    """
+    mask = 0
+    for record_type in record_types:
+        mask |= 1 << record_type
+    return mask
+
+def pack_header(record_type, frame_number, frame_time):
+    """
+    Returns the header for a record of type record_type that belongs to the
+    camera snapshot with number frame_number and capture time frame_time.
+    """
+    return HEADER.pack(record_type, frame_number & 0xffffffff, frame_time)
+
+def pack_ttc_record(min_ttc, left_ttc, right_ttc, frame_number, frame_time):
+    """
+    Returns the TTC record with the TTC values min_ttc, left_ttc and right_ttc
+    of the camera snapshot with number frame_number and capture time
+    frame_time.
+    """
+    return pack_header(RECORD_TTC, frame_number, frame_time) + \
+           TTC_VALUES.pack(min_ttc, left_ttc, right_ttc)
+
+def pack_zone_ttc_record(zone_ttcs, frame_number, frame_time):
+    """
+    Returns the zone TTC record with the TTC values zone_ttcs (with one row
+    per row of zones) of the camera snapshot with number frame_number and
+    capture time frame_time.
+    """
+    rows = len(zone_ttcs)
+    columns = len(zone_ttcs[0]) if rows > 0 else 0
+    values = [float(ttc) for row in zone_ttcs for ttc in row]
+    return pack_header(RECORD_ZONE_TTC, frame_number, frame_time) + \
+           ZONE_GRID.pack(rows, columns) + \
+           struct.pack('>%dd' % len(values), *values)
+
+def unpack_header(data):
+    """
+    Returns the record type, frame number and capture time from the header
+    at the beginning of the record data.
+    """
+    return HEADER.unpack_from(data)
+
+def unpack_ttc_record(data):
+    """
+    Returns the minimum, left and right TTC values of the TTC record data.
+    """
+    return TTC_VALUES.unpack_from(data, HEADER.size)
+
+def unpack_zone_ttc_record(data):
+    """
+    Returns the TTC values of the zone TTC record data as a list of rows of
+    zones.
+    """
+    rows, columns = ZONE_GRID.unpack_from(data, HEADER.size)
+    values = struct.unpack_from('>%dd' % (rows * columns), data, \
+                                HEADER.size + ZONE_GRID.size)
+    return [list(values[row * columns:(row + 1) * columns]) \
+            for row in range(rows)]
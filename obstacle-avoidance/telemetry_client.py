@@ -0,0 +1,69 @@
+"""
+This module implements a client that receives image frames and TTC values
+from a telemetry server.
+"""
+
+__author__ = "Ron Wright"
+__copyright__ = "Copyright 2015 Ronald Joseph Wright"
+__maintainer__ = "Ron Wright"
+
+import socket, socket_util
+import telemetry
+import numpy as np
+import cv2
+
+class TelemetryClient:
+    """
+    Class for receiving image frames and TTC values from a telemetry server
+    """
+    def __init__(self, host, port=33333, record_types=None):
+        """
+        Constructor for TelemetryClient, where host is the hostname or IP
+        address of the telemetry server, the optional parameter port (with
+        default value 33333) is the port number of the telemetry server, and
+        the optional parameter record_types (with default value None) is the
+        list of record types to receive (or None to receive all of them). The
+        record types are chosen right away, so that the server does not wait
+        for the choice before sending records.
+        """
+        self.s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.s.connect((host, port))
+        self.reader = socket_util.SocketReader(self.s)
+        self.record_buffer = bytearray()
+        if record_types is None:
+            record_types = [telemetry.RECORD_FRAME, telemetry.RECORD_TTC, \
+                            telemetry.RECORD_ZONE_TTC]
+        self.s.sendall(bytes(bytearray( \
+            [telemetry.subscription_mask(record_types)])))
+
+    def get_record(self):
+        """
+        Retrieves the next record from the server and returns it as a tuple
+        containing the record type, the frame number, the capture time and the
+        value of the record. The value is the image frame for RECORD_FRAME,
+        the triple of minimum, left and right TTC values for RECORD_TTC, and
+        the list of rows of zone TTC values for RECORD_ZONE_TTC. In the case
+        of an error, None is returned.
+        """
+        msglen = self.reader.recv_msg_into(self.record_buffer)
+        if msglen is None or msglen < telemetry.HEADER.size:
+            return None
+        record_type, frame_number, frame_time = \
+            telemetry.unpack_header(self.record_buffer)
+        if record_type == telemetry.RECORD_FRAME:
+            value = cv2.imdecode(np.frombuffer(self.record_buffer, \
+                dtype=np.uint8, count=msglen - telemetry.HEADER.size, \
+                offset=telemetry.HEADER.size), 1)
+        elif record_type == telemetry.RECORD_TTC:
+            value = telemetry.unpack_ttc_record(self.record_buffer)
+        elif record_type == telemetry.RECORD_ZONE_TTC:
+            value = telemetry.unpack_zone_ttc_record(self.record_buffer)
+        else:
+            value = None
+        return (record_type, frame_number, frame_time, value)
+
+    def shutdown(self):
+        """
+        Shuts down the telemetry client.
+        """
+        self.s.shutdown(socket.SHUT_RDWR)
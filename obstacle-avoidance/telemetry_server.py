@@ -0,0 +1,118 @@
+"""
+This module implements a server that sends image frames and TTC values to
+connected clients in real time over a single connection per client, using the
+records defined in the telemetry module. Frames are sent latest-only, while
+TTC values are sent in order. Frames are encoded into JPEG format by a
+FrameEncoder in its own thread, which can also be shared with other servers.
+"""
+
+__author__ = "Ron Wright"
+__copyright__ = "Copyright 2015 Ronald Joseph Wright"
+__maintainer__ = "Ron Wright"
+
+from push_server import PushServer
+from frame_encoder import FrameEncoder
+import telemetry
+
+class TelemetryServer(PushServer):
+    """
+    Class for sending image frames and TTC values to clients in real time
+    """
+    def __init__(self, port=33333, backlog=5, queue_size=30, max_lag=None, \
+                 quality=80, scale=1.0, adaptive=True, encode_frames=True, \
+                 subscription_grace_period=0.5):
+        """
+        Constructor for TelemetryServer, where the optional parameter port
+        (with default value 33333) is the port number to use for the
+        telemetry server, the optional parameter backlog (with default value
+        5) is the maximum number of incoming client connections that can wait
+        between successive accept calls, the optional parameter queue_size
+        (with default value 30) is the maximum number of records waiting to
+        be sent to each client, and the optional parameter max_lag (with
+        default value None) is the number of records that can be dropped in a
+        row for a client before it is disconnected (or None if clients are
+        never disconnected for lagging). The optional parameters quality (with
+        default value 80), scale (with default value 1.0) and adaptive (with
+        default value True) are the JPEG quality, the factor by which frames
+        are resized, and whether both are adapted automatically (see
+        FrameEncoder). If the optional parameter encode_frames (with default
+        value True) is False, the server does not have an encoder of its own,
+        and frames that are already encoded must be sent with
+        push_encoded_frame instead of push_frame. The optional parameter
+        subscription_grace_period (with default value 0.5) is the time (in
+        seconds) that new clients have to choose the record types they want
+        before records are sent to them (see PushServer).
+        """
+        super(TelemetryServer, self).__init__(port, backlog, False, \
+                                              queue_size, max_lag, None, \
+                                              subscription_grace_period)
+        self.num_dropped_records = 0
+        self.encoder = None
+        if encode_frames:
+            self.encoder = FrameEncoder(self.push_encoded_frame, quality, \
+                                        scale, adaptive, \
+                                        congestion_func=self.is_congested)
+            self.encoder.start()
+
+    def is_congested(self):
+        """
+        Returns whether any records were dropped for clients that want frames
+        since the last call, which can be used as the congestion function of
+        a FrameEncoder.
+        """
+        num_dropped = self.get_dropped_count(telemetry.RECORD_FRAME)
+        congested = num_dropped > self.num_dropped_records
+        self.num_dropped_records = num_dropped
+        return congested
+
+    def has_frame_clients(self):
+        """
+        Returns whether any connected clients want image frames.
+        """
+        return self.has_clients(telemetry.RECORD_FRAME)
+
+    def push_frame(self, the_frame, frame_number, frame_time):
+        """
+        Sets the frame with number frame_number and capture time frame_time to
+        be sent to connected clients. Clients are notified only when the frame
+        is valid. The frame is not encoded if no clients want frames. The
+        frame is encoded in the encoder thread, so it must not be modified
+        afterwards.
+        """
+        if not self.has_frame_clients():
+            return
+        self.encoder.submit(the_frame, frame_number, frame_time)
+
+    def push_encoded_frame(self, jpeg, frame_number, frame_time):
+        """
+        Sends the JPEG data jpeg of the frame with number frame_number and
+        capture time frame_time, which has already been encoded, to connected
+        clients.
+        """
+        super(TelemetryServer, self).push_message( \
+            telemetry.pack_header(telemetry.RECORD_FRAME, frame_number, \
+                                  frame_time) + jpeg, \
+            telemetry.RECORD_FRAME, True)
+
+    def push_ttc_values(self, min_ttc, left_ttc, right_ttc, frame_number, \
+                        frame_time):
+        """
+        Sets the TTC values min_ttc, left_ttc and right_ttc of the camera
+        snapshot with number frame_number and capture time frame_time to be
+        sent to connected clients.
+        """
+        super(TelemetryServer, self).push_message( \
+            telemetry.pack_ttc_record(min_ttc, left_ttc, right_ttc, \
+                                      frame_number, frame_time), \
+            telemetry.RECORD_TTC)
+
+    def push_zone_ttc_values(self, zone_ttcs, frame_number, frame_time):
+        """
+        Sets the TTC values zone_ttcs of the zones of the camera snapshot with
+        number frame_number and capture time frame_time to be sent to
+        connected clients.
+        """
+        super(TelemetryServer, self).push_message( \
+            telemetry.pack_zone_ttc_record(zone_ttcs, frame_number, \
+                                           frame_time), \
+            telemetry.RECORD_ZONE_TTC)
@@ -6,27 +6,53 @@ __author__ = "Ron Wright"
 __copyright__ = "Copyright 2015 Ronald Joseph Wright"
 __maintainer__ = "Ron Wright"
 
-import socket, socket_util
+from ttc_server import TTCServer
+import socket, socket_util, telemetry
 
 class TTCClient:
     """
     Class for receiving TTC values from a TTC server
     """
-    def __init__(self, host, port=22222):
+    def __init__(self, host, port=22222, binary=False):
         """
         Constructor for TTCClient, where host is the hostname or IP address of
-        the TTC server, and the optional parameter port (with default value
-        22222) is the port number of the frame server.
+        the TTC server, the optional parameter port (with default value
+        22222) is the port number of the frame server, and the optional
+        parameter binary (with default value False) determines whether the
+        TTC values are received as compact binary TTC records (see the
+        telemetry module) instead of JSON.
         """
         self.s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.s.connect((host, port))
+        self.reader = socket_util.SocketReader(self.s)
+        self.binary = binary
+        # Choose the encoding right away, so that the server does not wait
+        # for the choice before sending TTC values
+        encoding = TTCServer.ENCODING_BINARY if binary \
+                   else TTCServer.ENCODING_JSON
+        self.s.sendall(bytes(bytearray([1 << encoding])))
     
     def get_ttc_values(self):
         """
-        Retrieves the TTC values from the server and returns them as a triple.
-        In the case of an error, None is returned.
+        Retrieves the TTC values from the server and returns them as a
+        dictionary with the keys 'min-ttc', 'left-ttc' and 'right-ttc'. With
+        binary TTC records, the dictionary also contains the keys
+        'frame-number' and 'frame-time', and infinite TTC values are given as
+        float('inf') instead of 'Infinity'. In the case of an error, None is
+        returned.
         """
-        return socket_util.recv_msg_as_json(self.s)
+        if not self.binary:
+            return self.reader.recv_json_msg()
+
+        message = self.reader.recv_msg()
+        if message is None or \
+           len(message) < telemetry.HEADER.size + telemetry.TTC_VALUES.size:
+            return None
+        _, frame_number, frame_time = telemetry.unpack_header(message)
+        min_ttc, left_ttc, right_ttc = telemetry.unpack_ttc_record(message)
+        return {'frame-number': frame_number, 'frame-time': frame_time, \
+                'min-ttc': min_ttc, 'left-ttc': left_ttc, \
+                'right-ttc': right_ttc}
 
     def shutdown(self):
         """
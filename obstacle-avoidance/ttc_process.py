@@ -0,0 +1,148 @@
+"""
+This module implements a separate process for TTC computations, which allows
+the TTC computations to run on a different core than the rest of the obstacle
+avoider. The feature points are handed to the process through a shared memory
+buffer, and only small messages are sent over a pipe. The TTC computations
+only need the size of each frame, so no image data are sent to the process.
+
+The process is started with the spawn start method, so it does not inherit
+any locks held by other threads at the time it is started. Python 2.x can only
+fork processes, so the default start method is used there.
+"""
+
+__author__ = "Ron Wright"
+__copyright__ = "Copyright 2015 Ronald Joseph Wright"
+__maintainer__ = "Ron Wright"
+
+try:
+    from multiprocessing import get_context
+    multiprocessing_context = get_context('spawn')
+except ImportError:
+    import multiprocessing as multiprocessing_context
+from frame_worker import FrameWorker
+import numpy as np
+
+class TTCProcessState:
+    """
+    Class holding the state that the TTC computations need inside the TTC
+    process. It stands in for the obstacle avoider thread, which lives in the
+    parent process.
+    """
+    def __init__(self, capacity, scale_filter, zone_grid, zone_filter, roi):
+        """
+        Constructor for TTCProcessState, where capacity is the maximum number
+        of feature points that can be handled, scale_filter is the filter to
+        use for the TTC computations, zone_grid is the pair containing the
+        number of rows and columns of zones (or None), zone_filter is the
+        filter to use for the TTC computations of the zones, and roi is the
+        region of interest that the zones are laid over (or None for the
+        entire frame).
+        """
+        self.local_scales = np.zeros((capacity, 1))
+        self.left_scales = np.zeros((capacity, 1))
+        self.right_scales = np.zeros((capacity, 1))
+        self.scale_filter = scale_filter
+        self.zone_grid = zone_grid
+        self.zone_filter = zone_filter
+        self.roi = roi
+        self.reset_filters()
+
+    def reset_filters(self):
+        """
+        Resets the state of all filters.
+        """
+        self.scale_filter.reset_filter()
+        if self.zone_filter is not None:
+            self.zone_filter.reset_filter()
+
+def run_ttc_process(conn, points_buffer, capacity, scale_filter, zone_grid, \
+                    zone_filter, roi):
+    """
+    TTC process function that computes the TTC values for each frame sent
+    through the pipe conn until it receives None. The process works on its
+    own copies of the filters scale_filter and zone_filter. This function
+    should not be used directly outside this module.
+    """
+    points = np.frombuffer(points_buffer, dtype=np.float32) \
+               .reshape((2, capacity, 2))
+    state = TTCProcessState(capacity, scale_filter, zone_grid, zone_filter, \
+                            roi)
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        if message == 'reset':
+            state.reset_filters()
+            continue
+
+        num_points, frame_shape, frame_time, old_frame_time = message
+        worker = FrameWorker(state, None, frame_shape, frame_time, \
+            old_frame_time, points[0, :num_points], points[1, :num_points])
+        worker.ttc_computation_function()
+        conn.send((worker.get_ttc_values(), worker.get_zone_ttc_values(), \
+                   worker.has_lost_tracking()))
+
+class TTCProcess:
+    """
+    Class for running TTC computations in a separate process.
+    """
+    def __init__(self):
+        """
+        Constructor for TTCProcess. The process itself is started by start.
+        """
+        self.process = None
+        self.conn = None
+        self.capacity = 0
+        self.points = None
+
+    def start(self, capacity, the_thread):
+        """
+        Starts the TTC process with a shared memory buffer for up to capacity
+        feature points, using copies of the filters, the zone grid and the
+        region of interest of the obstacle avoider thread the_thread.
+        """
+        points_buffer = multiprocessing_context.RawArray('f', 4*capacity)
+        self.points = np.frombuffer(points_buffer, dtype=np.float32) \
+                        .reshape((2, capacity, 2))
+        self.capacity = capacity
+
+        self.conn, child_conn = multiprocessing_context.Pipe()
+        self.process = multiprocessing_context.Process( \
+            target=run_ttc_process, \
+            args=(child_conn, points_buffer, capacity, \
+                  the_thread.scale_filter, the_thread.zone_grid, \
+                  the_thread.zone_filter, the_thread.roi))
+        self.process.daemon = True
+        self.process.start()
+
+    def compute(self, worker):
+        """
+        Computes the TTC values for the FrameWorker worker in the TTC process
+        and stores the results in worker.
+        """
+        num_points = len(worker.good_new)
+
+        # Copy the feature points into shared memory
+        self.points[0, :num_points] = worker.good_old
+        self.points[1, :num_points] = worker.good_new
+
+        self.conn.send((num_points, worker.frame_shape, worker.frame_time, \
+                        worker.old_frame_time))
+        ttc_values, worker.zone_ttcs, worker.lost_tracking = self.conn.recv()
+        worker.min_ttc, worker.left_ttc, worker.right_ttc = ttc_values
+
+    def reset_filters(self):
+        """
+        Resets the state of the filters used by the TTC process.
+        """
+        if self.process is not None:
+            self.conn.send('reset')
+
+    def shutdown(self):
+        """
+        Stops the TTC process.
+        """
+        if self.process is not None:
+            self.conn.send(None)
+            self.process.join()
+            self.process = None
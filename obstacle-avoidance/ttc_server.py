@@ -1,6 +1,10 @@
 """
 This module implements a server that sends TTC values to connected clients in
-real time.
+real time. Clients get the TTC values in JSON format by default, and can ask
+for compact binary TTC records instead by choosing the ENCODING_BINARY record
+type. Binary TTC records are the same as the RECORD_TTC records of the
+telemetry channel (see the telemetry module). Each encoding is only produced
+if a client wants it, and a client only gets the encoding it chose.
 """
 
 __author__ = "Ron Wright"
@@ -8,22 +12,40 @@ __copyright__ = "Copyright 2015 Ronald Joseph Wright"
 __maintainer__ = "Ron Wright"
 
 from push_server import PushServer
-import socket_util
+import telemetry
 from math import isinf
+from json import dumps
+import time
 
 class TTCServer(PushServer):
     """
     Class for sending TTC values to clients in real time
     """
-    def __init__(self, port=22222, backlog=5):
+    # Record types of the encodings
+    ENCODING_JSON = 0
+    ENCODING_BINARY = 1
+
+    def __init__(self, port=22222, backlog=5, queue_size=30, max_lag=None, \
+                 subscription_grace_period=0.5):
         """
         Constructor for TTCServer, where the optional parameter port (with
         default value 22222) is the port number to use for the TTC server,
-        and the optional parameter backlog (with default value 5) is the
-        maximum number of incoming client connections that can wait between
-        successive accept calls.
+        the optional parameter backlog (with default value 5) is the maximum
+        number of incoming client connections that can wait between
+        successive accept calls, the optional parameter queue_size (with
+        default value 30) is the maximum number of TTC values waiting to be
+        sent to each client in order, and the optional parameter max_lag
+        (with default value None) is the number of TTC values that can be
+        dropped in a row for a client before it is disconnected (or None if
+        clients are never disconnected for lagging). The optional parameter
+        subscription_grace_period (with default value 0.5) is the time (in
+        seconds) that new clients have to choose an encoding before TTC
+        values are sent to them, so that a client that asks for binary TTC
+        records never gets JSON messages first (see PushServer).
         """
-        super(TTCServer, self).__init__(port, backlog, True)
+        super(TTCServer, self).__init__(port, backlog, False, queue_size, \
+            max_lag, 1 << TTCServer.ENCODING_JSON, subscription_grace_period)
+        self.frame_number = 0
 
     @staticmethod
     def sanitize_number(number):
@@ -33,12 +55,36 @@ class TTCServer(PushServer):
         """
         return 'Infinity' if isinf(number) else number
 
-    def push_ttc_values(self, min_ttc, left_ttc, right_ttc):
+    def push_ttc_values(self, min_ttc, left_ttc, right_ttc, zone_ttcs=None, \
+                        frame_number=None, frame_time=None):
         """
         Sets the frame to be sent to connected clients. Clients are notified
-        only when the frame is valid.
+        only when the frame is valid. If the optional parameter zone_ttcs
+        (with default value None) is given, the TTC values of the zones are
+        sent as well, as a list of rows of zones, but only in JSON format.
+        The optional parameters frame_number and frame_time (with default
+        values None) are the number and capture time of the camera snapshot
+        that the TTC values belong to, which default to a running count and
+        the current time, and are only sent in binary TTC records.
         """
-        super(TTCServer, self).push_message(\
-            {'min-ttc': TTCServer.sanitize_number(min_ttc), \
-             'left-ttc': TTCServer.sanitize_number(left_ttc), \
-             'right-ttc': TTCServer.sanitize_number(right_ttc)})
+        if frame_number is None:
+            self.frame_number += 1
+            frame_number = self.frame_number
+        if frame_time is None:
+            frame_time = time.time()
+
+        if self.has_clients(TTCServer.ENCODING_JSON):
+            message = {'min-ttc': TTCServer.sanitize_number(min_ttc), \
+                       'left-ttc': TTCServer.sanitize_number(left_ttc), \
+                       'right-ttc': TTCServer.sanitize_number(right_ttc)}
+            if zone_ttcs is not None:
+                message['zone-ttc'] = \
+                    [[TTCServer.sanitize_number(float(ttc)) for ttc in row] \
+                     for row in zone_ttcs]
+            super(TTCServer, self).push_message( \
+                dumps(message).encode('utf-8'), TTCServer.ENCODING_JSON)
+        if self.has_clients(TTCServer.ENCODING_BINARY):
+            super(TTCServer, self).push_message( \
+                telemetry.pack_ttc_record(min_ttc, left_ttc, right_ttc, \
+                                          frame_number, frame_time), \
+                TTCServer.ENCODING_BINARY)